@@ -0,0 +1,191 @@
+import os
+import re
+import threading
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Offline analysis of large text captures. The file is split into newline aligned chunks which are scanned
+# in worker processes, results are handed back chunk by chunk as they complete.
+
+MODES = ['search', 'filter', 'count']
+
+def chunkOffsets(path: str, chunkSize: int = 16 * 1024 * 1024):
+    size = os.path.getsize(path)
+    offsets = []
+    start = 0
+
+    with open(path, 'rb') as file:
+        while start < size:
+            end = min(size, start + chunkSize)
+
+            # move the end past the next newline so no line is split between chunks
+            if end < size:
+                file.seek(end)
+                file.readline()
+                end = min(size, file.tell())
+
+            offsets.append((start, end))
+            start = end
+
+    return offsets
+
+# (start, end) spans of the lines in data with a match, end includes the newline
+def matchingSpans(data: bytes, regex):
+    spans = []
+    pos = 0
+    length = len(data)
+
+    while pos < length:
+        match = regex.search(data, pos)
+
+        if not match:
+            break
+
+        start = data.rfind(b'\n', 0, match.start()) + 1
+        end = data.find(b'\n', match.start())
+        end = length if end == -1 else end + 1
+
+        # a zero width match after the final newline has no line around it
+        if end > start:
+            spans.append((start, end))
+
+        pos = end
+
+    return spans
+
+# spans of the lines in data without a match
+def complementSpans(spans, length: int):
+    result = []
+    pos = 0
+
+    for start, end in spans:
+        if start > pos:
+            result.append((pos, start))
+
+        pos = end
+
+    if pos < length:
+        result.append((pos, length))
+
+    return result
+
+def readChunk(path: str, start: int, end: int):
+    with open(path, 'rb') as file:
+        file.seek(start)
+        return file.read(end - start)
+
+def selectedSpans(data: bytes, pattern: bytes, mode: str):
+    spans = matchingSpans(data, re.compile(pattern))
+
+    return complementSpans(spans, len(data)) if mode == 'filter' else spans
+
+# worker: returns (chunk start, number of selected lines, up to `keep` (offset, line) pairs)
+def scanChunk(path: str, start: int, end: int, pattern: bytes, mode: str, keep: int):
+    data = readChunk(path, start, end)
+    spans = selectedSpans(data, pattern, mode)
+
+    if mode == 'count':
+        return start, len(spans), []
+
+    lines = []
+
+    for spanStart, spanEnd in spans:
+        if len(lines) >= keep:
+            break
+
+        # filter spans can hold several lines
+        offset = spanStart
+
+        for line in data[spanStart:spanEnd].splitlines(True):
+            if len(lines) >= keep:
+                break
+
+            lines.append((start + offset, line.rstrip(b'\r\n').decode('utf-8', 'replace')))
+            offset += len(line)
+
+    count = len(spans) if mode == 'search' else sum(data.count(b'\n', s, e) + (data[e - 1:e] != b'\n') for s, e in spans)
+
+    return start, count, lines
+
+# worker: returns the selected lines of a chunk as bytes, ready to be written to an export
+def exportChunk(path: str, start: int, end: int, pattern: bytes, mode: str):
+    data = readChunk(path, start, end)
+    view = memoryview(data)
+
+    return b''.join(view[s:e] for s, e in selectedSpans(data, pattern, mode))
+
+class Analysis:
+    def __init__(self, path: str, pattern: str, mode: str = 'search', chunkSize: int = 16 * 1024 * 1024, workers: int = None, keep: int = 10000):
+        self.path = path
+        self.pattern = pattern.encode('utf-8')
+        self.mode = mode
+        self.chunkSize = chunkSize
+        self.workers = workers
+        # at most this many result lines are handed back for display
+        self.keep = keep
+
+        # fail early on a bad pattern, workers compile their own copy
+        re.compile(self.pattern)
+
+        self.chunks = 0
+        self.done = 0
+        self.count = 0
+        self.kept = 0
+
+        self.executor = None
+        self.thread = None
+        self.canceled = False
+
+    # scan in the background, onresult(lines) is called from a worker thread as chunks complete
+    def start(self, onresult = None, ondone = None):
+        self.thread = threading.Thread(target=self.run, args=[ onresult, ondone ], daemon=True)
+        self.thread.start()
+
+    def run(self, onresult, ondone):
+        offsets = chunkOffsets(self.path, self.chunkSize)
+        self.chunks = len(offsets)
+
+        with ProcessPoolExecutor(self.workers) as executor:
+            self.executor = executor
+
+            futures = [executor.submit(scanChunk, self.path, start, end, self.pattern, self.mode, self.keep) for start, end in offsets]
+
+            for future in as_completed(futures):
+                if self.canceled:
+                    break
+
+                start, count, lines = future.result()
+
+                lines = lines[:max(0, self.keep - self.kept)]
+
+                self.done += 1
+                self.count += count
+                self.kept += len(lines)
+
+                if onresult:
+                    onresult(lines)
+
+        if ondone and not self.canceled:
+            ondone()
+
+    # write the selected lines to outPath in file order, onprogress(done, total) is called per chunk
+    def export(self, outPath: str, onprogress = None):
+        offsets = chunkOffsets(self.path, self.chunkSize)
+
+        with ProcessPoolExecutor(self.workers) as executor, open(outPath, 'wb') as out:
+            chunks = executor.map(exportChunk, *zip(*[(self.path, start, end, self.pattern, self.mode) for start, end in offsets])) if offsets else []
+
+            for done, data in enumerate(chunks, 1):
+                if self.canceled:
+                    break
+
+                out.write(data)
+
+                if onprogress:
+                    onprogress(done, len(offsets))
+
+    def cancel(self):
+        self.canceled = True
+
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,108 @@
+import threading
+
+from collections import deque
+
+import metrics
+
+# Text waiting between the reader thread and the UI. The UI takes a bounded amount each frame, so when the
+# display can't keep up the backlog grows until it reaches the high mark, and then the policy decides:
+#   flow-control  stop reading the port until the UI is back below the low mark, the driver's buffer fills
+#                 and RTS/CTS or XON/XOFF (if enabled) hold the device off
+#   drop-oldest   throw away the oldest waiting text down to the low mark
+#   drop-marker   throw away new text until the UI is back below the low mark, then show how much was lost
+
+POLICIES = ['flow-control', 'drop-oldest', 'drop-marker']
+
+droppedBytes = metrics.registry.counter('serial_dropped_bytes_total', 'received bytes dropped because the display fell behind')
+uiBacklog    = metrics.registry.gauge('serial_ui_backlog_chars', 'decoded text waiting to be displayed')
+
+class Backlog:
+    def __init__(self, high: int = 4 * 1024 * 1024, low: int = 1024 * 1024, policy: str = 'flow-control'):
+        self.high = high
+        self.low = min(low, high)
+        self.policy = policy
+
+        self.chunks = deque()
+        self.size = 0
+
+        # drop-marker: dropping until the UI catches up, and how much has gone since the last marker
+        self.shedding = False
+        self.dropped = 0
+
+        self.closed = False
+        self.condition = threading.Condition()
+
+    # called by the reader, nbytes is how many received bytes the text came from
+    def put(self, text: str, nbytes: int = None, force = False):
+        nbytes = len(text) if nbytes is None else nbytes
+
+        with self.condition:
+            if force:
+                pass
+            elif self.policy == 'drop-marker':
+                if self.shedding or self.size + len(text) > self.high:
+                    self.shedding = True
+                    self.dropped += nbytes
+                    droppedBytes.inc(nbytes)
+                    return
+            elif self.policy == 'flow-control':
+                if self.size >= self.high:
+                    while self.size > self.low and not self.closed:
+                        self.condition.wait()
+
+            self.chunks.append(text)
+            self.size += len(text)
+
+            if self.policy == 'drop-oldest' and self.size > self.high:
+                self.trim()
+
+    # drop the oldest text until only `low` is left
+    def trim(self):
+        excess = self.size - self.low
+
+        while excess > 0:
+            chunk = self.chunks.popleft()
+
+            if len(chunk) > excess:
+                self.chunks.appendleft(chunk[excess:])
+                chunk = chunk[:excess]
+
+            excess -= len(chunk)
+            self.size -= len(chunk)
+            droppedBytes.inc(len(chunk))
+
+    # called by the UI, returns up to `limit` characters of waiting text
+    def drain(self, limit: int):
+        parts = []
+        taken = 0
+
+        with self.condition:
+            while self.chunks and taken < limit:
+                chunk = self.chunks.popleft()
+
+                if taken + len(chunk) > limit:
+                    self.chunks.appendleft(chunk[limit - taken:])
+                    chunk = chunk[:limit - taken]
+
+                parts.append(chunk)
+                taken += len(chunk)
+
+            self.size -= taken
+
+            if self.shedding and self.size <= self.low:
+                self.shedding = False
+                parts.append(f"\n[{self.dropped} bytes dropped]\n")
+                self.dropped = 0
+
+            if taken:
+                self.condition.notify_all()
+
+            uiBacklog.set(self.size)
+
+        return ''.join(parts)
+
+    # lets a reader blocked on flow control go
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
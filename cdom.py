@@ -4,10 +4,28 @@ from math import ceil
 
 import functools
 import re
+import time
+
+import metrics
+
+from collections import OrderedDict
+
+import keymap
+
+from cellwidth import textWidth, truncate
+
+from element import Wallbreak
+
+renderSeconds = metrics.registry.histogram('cdom_render_seconds', 'time taken to render a frame')
 
 def ellipsis(text: str, usable_space: int):
-    tooSmall = usable_space < len(text)
-    return '' if usable_space == 0 else text[:usable_space - tooSmall] + ('…' if tooSmall else '')
+    if usable_space <= 0:
+        return ''
+
+    if textWidth(text) <= usable_space:
+        return text
+
+    return truncate(text, usable_space - 1) + '…'
 
 class CDOMStyle:
     def __init__(self, backgroundColor: tuple, wallColor: tuple, titleColor: tuple, textColor: tuple, shadowColor: tuple, highlightedColor: tuple):
@@ -31,6 +49,48 @@ class CDOMStyle:
         curses.init_pair(6, highlightedColor[0], highlightedColor[1])
         self.highlightedColor = curses.color_pair(6)
 
+# part of a windowed page with its own curses window, repainted only when the lines it shows change
+class Region:
+    __slots__ = ('window', 'geometry', 'drawn')
+
+    def __init__(self):
+        self.window = None
+        self.geometry = None
+        # the writes last painted, the region is dirty when new ones differ
+        self.drawn = None
+
+    def place(self, height: int, width: int, top: int, left: int, color):
+        geometry = (height, width, top, left)
+
+        if geometry != self.geometry:
+            self.geometry = geometry
+
+            try:
+                self.window = curses.newwin(height, width, top, left) if height > 0 and width > 0 else None
+            except curses.error:
+                self.window = None
+
+            if self.window:
+                self.window.bkgd(' ', color)
+
+        # whatever was under the region has just been redrawn
+        self.drawn = None
+
+    def paint(self, ops):
+        if self.window is None or ops == self.drawn:
+            return
+
+        self.window.erase()
+
+        for row, col, string, color in ops:
+            try:
+                self.window.addstr(row, col, string, color)
+            except (curses.error, ValueError):
+                pass
+
+        self.window.noutrefresh()
+        self.drawn = ops
+
 # Stands for Curses Document Object Model, modeled loosely after the javascript DOM
 
 # CDOM -> window
@@ -74,8 +134,17 @@ class CDOM:
     # 3 is the length/2 of the title's padding: '┌┤  ├┐'
     MIN_TITLE_PADDING = 3
 
-    def __init__(self, stdscr, style):
-        self.pages = []
+    def __init__(self, stdscr, style, cacheSize: int = 8):
+        # url -> Page
+        self.routes = {}
+        # url -> function returning a Page, built the first time the url is visited
+        self.factories = {}
+
+        # live instances of stateless pages that were navigated away from, least recently used first
+        self.pageCache = OrderedDict()
+        self.cacheSize = cacheSize
+        # called with each page evicted from the cache, after it's been unloaded
+        self.onevict = []
         self.stdscr = stdscr
 
         self.style = style
@@ -86,22 +155,65 @@ class CDOM:
 
         self.logString = ''
 
+        # header state and regions for windowed pages, see renderWindowed
+        self.frameKey = None
+        self.controlsRegion = Region()
+        self.streamRegion = Region()
+
         self.history = []
+        self.future = []
         self.currentPage = None
 
+        # bindings that apply on every page, see keymap.py
+        self.keymap = keymap.globalKeymap
+
     def addPages(self, *pages):
         for page in pages:
             page.setCDOM(self)
-            self.pages.append(page)
+            self.routes[page.url] = page
+
+            if page.url in keymap.pageKeymaps:
+                page.keymap.update(keymap.pageKeymaps[page.url])
+
+    def handleKey(self, e):
+        if self.currentPage:
+            keymap.dispatch(self, e)
     
+    def registerPage(self, url: str, factory):
+        self.factories[url] = factory
+
+    def registerPages(self, factories: dict):
+        for url, factory in factories.items():
+            self.registerPage(url, factory)
+
+    # find the page for a url, building it if it's only been registered
+    def route(self, url: str):
+        page = self.routes.get(url)
+
+        if page is None and url in self.factories:
+            page = self.factories.pop(url)()
+            self.addPages(page)
+
+        return page
+
     def loadPage(self, url: str, fromHistoryPage = False):
-        # find page with matching url
-        page = [page for page in self.pages if page.url == url]
+        template = self.route(url)
 
-        if len(page) == 0:
+        if template is None:
             return None
-        
-        page = page[0].copy() if page[0].stateless else page[0]
+
+        if template.stateless:
+            # going back or forward resumes the live instance with its scroll and selection
+            if fromHistoryPage and url in self.pageCache:
+                return self.pageCache.pop(url)
+
+            # a fresh visit replaces the old instance, which has to let go of its resources first
+            if url in self.pageCache:
+                self.evict(url)
+
+            page = template.copy()
+        else:
+            page = template
 
         # load elements and page
         for element in page.elements:
@@ -114,8 +226,43 @@ class CDOM:
         if page.onload:
             page.onload(page)
 
+        page.loaded = True
+
         return page
 
+    def unloadPage(self, page):
+        if not page.loaded:
+            return
+
+        page.loaded = False
+
+        for element in page.elements:
+            if hasattr(element, 'defaultOnunload'):
+                element.defaultOnunload()
+            if element.onunload:
+                element.onunload(element)
+        
+        if page.onunload:
+            page.onunload(page)
+
+    # keep a page we're leaving alive so history navigation can resume it
+    def cachePage(self, page):
+        if page.url in self.pageCache:
+            self.evict(page.url)
+
+        self.pageCache[page.url] = page
+
+        while len(self.pageCache) > self.cacheSize:
+            self.evict(next(iter(self.pageCache)))
+
+    def evict(self, url: str):
+        page = self.pageCache.pop(url)
+
+        self.unloadPage(page)
+
+        for hook in self.onevict:
+            hook(page)
+
     def goToPage(self, url: str, fromHistoryPage = False):
         # get page from url
         page = self.loadPage(url, fromHistoryPage)
@@ -123,28 +270,62 @@ class CDOM:
         if not page:
             return False
 
-        # unload the current page if there is one
-        if self.currentPage:
+        # leave the current page if there is one
+        if self.currentPage and self.currentPage is not page:
             if not fromHistoryPage:
                 self.history.append(self.currentPage.url)
+                self.future.clear()
 
-            for element in self.currentPage.elements:
-                if hasattr(element, 'defaultOnunload'):
-                    element.defaultOnunload()
-                if element.onunload:
-                    element.onunload(element)
-            
-            if self.currentPage.onunload:
-                self.currentPage.onunload(self.currentPage)
+            self.currentPage.displayLine = self.displayLine
+
+            if self.currentPage.stateless:
+                self.cachePage(self.currentPage)
+            else:
+                self.unloadPage(self.currentPage)
 
         # set current page and return True
         self.currentPage = page
+        self.displayLine = page.displayLine
+        return True
+
+    def goBack(self):
+        if not self.history:
+            return False
+
+        url = self.history.pop()
+        current = self.currentPage.url
+
+        if not self.goToPage(url, True):
+            return False
+
+        self.future.append(current)
+        return True
+
+    def goForward(self):
+        if not self.future:
+            return False
+
+        url = self.future.pop()
+        current = self.currentPage.url
+
+        if not self.goToPage(url, True):
+            return False
+
+        self.history.append(current)
         return True
     
     def goHome(self):
         if not self.goToPage('home'):
-            self.goToPage(self.pages[0].url)
-    
+            self.goToPage(next(iter(self.routes)) if self.routes else next(iter(self.factories)))
+
+    # unload every live page, call before exiting
+    def close(self):
+        while self.pageCache:
+            self.evict(next(iter(self.pageCache)))
+
+        if self.currentPage:
+            self.unloadPage(self.currentPage)
+
     def log(self, string):
         self.logString = str(string)
 
@@ -156,67 +337,97 @@ class CDOM:
 
     # normal call: pass in currentPage, height and width of terminal, it will render to fit
     def renderPage(self, page, height: int, width: int, top = None, left = None):
+        started = time.perf_counter()
+
         self.height = height
         self.width = width
 
         if height == 0 or width == 0:
             return
 
-        # remove elements that aren't to be displayed
-        elements = [elem for elem in page.elements if elem.style.display]
-
-        # clear background
+        # a frame that raises is still timed, the slow ones are the interesting ones
         try:
-            self.stdscr.bkgd(' ', self.style.backgroundColor)
-        except curses.error:
-            pass
+            # remove elements that aren't to be displayed
+            elements = [elem for elem in page.elements if elem.style.display]
 
-        if not page.highlightedElement:
-            page.selectNext()
+            if not page.highlightedElement:
+                page.selectNext()
 
-        # call page and each element's onrefresh method if they have one
-        for element in elements:
-            if hasattr(element, 'defaultOnrefresh'):
-                element.defaultOnrefresh()
-            if element.onrefresh:
-                element.onrefresh(element)
+            # call page and each element's onrefresh method if they have one
+            for element in elements:
+                if hasattr(element, 'defaultOnrefresh'):
+                    element.defaultOnrefresh()
+                if element.onrefresh:
+                    element.onrefresh(element)
         
-        if page.onrefresh:
-            page.onrefresh(page)
-
-        # calculate size of page
-        if page.size[0] is None:
-            pageHeight = functools.reduce(lambda acc, elem: acc + elem.displayHeight(), elements, 0) + page.style.margin[0] * 2
-        elif page.size[0] <= 0:
-            pageHeight = height + page.size[0] * 2
-        else:
-            pageHeight = page.size[0]
+            if page.onrefresh:
+                page.onrefresh(page)
+
+            # calculate size of page
+            if page.size[0] is None:
+                pageHeight = functools.reduce(lambda acc, elem: acc + elem.displayHeight(), elements, 0) + page.style.margin[0] * 2
+            elif page.size[0] <= 0:
+                pageHeight = height + page.size[0] * 2
+            else:
+                pageHeight = page.size[0]
+
+            pageWidth = 0
+
+            if page.size[1] is None:
+                for element in elements:
+                    if element.displayWidth() > pageWidth:
+                        pageWidth = element.displayWidth() + page.style.margin[1] * 2
+                
+                if textWidth(page.title) > pageWidth and page.style.border:
+                    pageWidth = textWidth(page.title) + CDOM.MIN_TITLE_PADDING * 2
+            elif page.size[1] <= 0:
+                pageWidth = width + page.size[1] * 2
+            else:
+                pageWidth = page.size[1]
+
+            # calculate useful constants
+            usableWidth = min(width, pageWidth)
+            usableHeight = min(height, pageHeight)
+        
+            textspace = max(0, usableWidth - page.style.margin[1] * 2)
+            linespace = max(0, usableHeight - page.style.margin[0] * 2)
 
-        pageWidth = 0
+            top = top or max(0, (height - pageHeight) // 2)
+            left = left or max(0, (width - pageWidth) // 2)
 
-        if page.size[1] is None:
-            for element in elements:
-                if element.displayWidth() > pageWidth:
-                    pageWidth = element.displayWidth() + page.style.margin[1] * 2
-                
-            if len(page.title) > pageWidth and page.style.border:
-                pageWidth = len(page.title) + CDOM.MIN_TITLE_PADDING * 2
-        elif page.size[1] <= 0:
-            pageWidth = width + page.size[1] * 2
-        else:
-            pageWidth = page.size[1]
+            page.displaySize = (usableHeight, usableWidth)
 
-        # calculate useful constants
-        usableWidth = min(width, pageWidth)
-        usableHeight = min(height, pageHeight)
-        
-        textspace = max(0, usableWidth - page.style.margin[1] * 2)
-        linespace = max(0, usableHeight - page.style.margin[0] * 2)
+            if page.windowed:
+                self.renderWindowed(page, elements, height, width, top, left, pageHeight, pageWidth, usableHeight, usableWidth, textspace, linespace)
+            else:
+                if self.frameKey is not None:
+                    # the last page was windowed, make sure all of the screen is redrawn from stdscr
+                    self.frameKey = None
+                    self.stdscr.touchwin()
+
+                self.drawFrame(page, height, width, top, left, pageHeight, pageWidth, usableHeight, usableWidth)
 
-        top = top or max(0, (height - pageHeight) // 2)
-        left = left or max(0, (width - pageWidth) // 2)
+                if height >= 1 and elements:
+                    self.scrollToHighlighted(page, linespace, sum(elem.displayHeight() for elem in elements))
 
-        page.displaySize = (usableHeight, usableWidth)
+                    for op in self.elementLines(page, elements, top + page.style.margin[0], left, textspace, linespace, self.displayLine):
+                        self.trystr(*op)
+
+                self.stdscr.move(0, 0)
+                self.trystr(0, 0, self.logString, self.style.shadowColor)
+
+                # Refresh the screen
+                self.stdscr.refresh()
+        finally:
+            renderSeconds.observe(time.perf_counter() - started)
+
+    # background, shadow, border and title, everything around the elements
+    def drawFrame(self, page, height: int, width: int, top: int, left: int, pageHeight: int, pageWidth: int, usableHeight: int, usableWidth: int):
+        # clear background
+        try:
+            self.stdscr.bkgd(' ', self.style.backgroundColor)
+        except curses.error:
+            pass
 
         # draw page shadow
         if page.style.shadow:
@@ -235,6 +446,8 @@ class CDOM:
         if height >= 1:
             # draw page border and title
             if page.style.border:
+                titleWidth = textWidth(page.title)
+
                 preTitle = [
                     '',
                     CDOM.CROSS,
@@ -243,13 +456,13 @@ class CDOM:
                     CDOM.HORIZONTAL + CDOM.PRE_TITLE_CHAR,
                     CDOM.HORIZONTAL + CDOM.PRE_TITLE_CHAR + ' ',
                     CDOM.HORIZONTAL + CDOM.PRE_TITLE_CHAR + ' '
-                ][min(6, width)] if width <= 6 + len(page.title) else CDOM.HORIZONTAL * (((usableWidth + 2 - len(page.title)) // 2) - 3) + CDOM.PRE_TITLE_CHAR + ' '
+                ][min(6, width)] if width <= 6 + titleWidth else CDOM.HORIZONTAL * (((usableWidth + 2 - titleWidth) // 2) - 3) + CDOM.PRE_TITLE_CHAR + ' '
                 postTitle = [
                     '',
                     CDOM.HORIZONTAL,
                     CDOM.POST_TITLE_CHAR + CDOM.HORIZONTAL,
                     ' ' + CDOM.POST_TITLE_CHAR + CDOM.HORIZONTAL
-                ][min(6, width) // 2] if width <= 6 + len(page.title) else ' ' + CDOM.POST_TITLE_CHAR + CDOM.HORIZONTAL * (ceil((usableWidth + 2 - len(page.title)) / 2) - 3)
+                ][min(6, width) // 2] if width <= 6 + titleWidth else ' ' + CDOM.POST_TITLE_CHAR + CDOM.HORIZONTAL * (ceil((usableWidth + 2 - titleWidth) / 2) - 3)
 
                 title = ellipsis(page.title, max(0, usableWidth - CDOM.MIN_TITLE_PADDING * 2))
 
@@ -261,8 +474,8 @@ class CDOM:
                 
                 if height > pageHeight + 1:
                     self.trystr(top - 1, left, preTitle, self.style.wallColor)
-                    self.trystr(top - 1, left + len(preTitle), title, self.style.titleColor | curses.A_BOLD)
-                    self.trystr(top - 1, left + len(preTitle + title), postTitle, self.style.wallColor)
+                    self.trystr(top - 1, left + textWidth(preTitle), title, self.style.titleColor | curses.A_BOLD)
+                    self.trystr(top - 1, left + textWidth(preTitle + title), postTitle, self.style.wallColor)
 
                 if height > pageHeight:
                     self.trystr(top + usableHeight, left, CDOM.HORIZONTAL * usableWidth, self.style.wallColor)
@@ -276,62 +489,87 @@ class CDOM:
             # draw background for page
             for line in range(usableHeight):
                 self.trystr(top + line, left, ' ' * usableWidth, self.style.textColor)
+
+    # adjust displayLine so the highlighted element is in view
+    def scrollToHighlighted(self, page, linespace: int, totalLines: int):
+        if page.highlightedElement:
+            highlightedLine = 1
             
-            # if ain't no elems, don't render ya dummy !
-            if len(elements) == 0:
-                return
+            for i in range(page.highlightedElement.index()):
+                highlightedLine += page.elements[i].displayHeight()
 
-            totalLines = functools.reduce(lambda acc, elem: acc + elem.displayHeight(), elements, 0)
+            if highlightedLine - self.displayLine >= linespace - 1:
+                self.displayLine = min(highlightedLine + 1 - linespace, totalLines - linespace)
+            elif highlightedLine < self.displayLine + 2:
+                self.displayLine = max(highlightedLine - 2, 0)
 
-            # get the line offset of the highlighted element and adjust displayLine to fit it
-            if page.highlightedElement:
-                highlightedLine = 1
-                
-                for i in range(page.highlightedElement.index()):
-                    highlightedLine += page.elements[i].displayHeight()
+    # the (row, col, string, color) writes that show `linespace` lines of elements starting at displayLine
+    def elementLines(self, page, elements, top: int, left: int, textspace: int, linespace: int, displayLine: int):
+        totalLines = sum(elem.displayHeight() for elem in elements)
+        ops = []
+        currentLine = 0
 
-                if highlightedLine - self.displayLine >= linespace - 1:
-                    self.displayLine = min(highlightedLine + 1 - linespace, totalLines - linespace)
-                elif highlightedLine < self.displayLine + 2:
-                    self.displayLine = max(highlightedLine - 2, 0)
+        for elem in elements:
+            for line in elem.lines():
 
-            currentLine = 0
+                if displayLine <= currentLine < linespace + displayLine:
+                    x = page.style.margin[1]
 
-            for elem in elements:
-                for line in elem.lines():
+                    if (currentLine - displayLine == linespace - 1 and currentLine != totalLines - 1) or (currentLine == displayLine and displayLine != 0):
+                        string = '…'
+                        unhighlighted_color = self.style.textColor
+                    else:
+                        string = line
 
-                    if currentLine >= self.displayLine:
+                        x += [
+                            elem.style.indent,
+                            (textspace - textWidth(string)) // 2,
+                            textspace - textWidth(string) - elem.style.indent
+                        ][elem.style.align.value]
 
-                        unhighlighted_color = self.style.textColor
-                        x = page.style.margin[1]
+                        unhighlighted_color = (self.style.textColor if not elem.style.color else curses.color_pair(elem.style.color)) | elem.style.weight
+
+                    string = ellipsis(string, textspace - elem.style.indent)
+
+                    if elem is page.highlightedElement:
+                        ops.append((top + currentLine - displayLine, left + x, string, self.style.highlightedColor | elem.style.weight | curses.A_BOLD))
+                    else:
+                        ops.append((top + currentLine - displayLine, left + x, string, unhighlighted_color or self.style.textColor | elem.style.weight))
+
+                currentLine += 1
+
+        return ops
+
+    # A windowed page is split at its first Wallbreak into a controls region and a stream region, each drawn
+    # into its own curses window. The frame (header) lives on stdscr and is only redrawn when the layout or
+    # title changes, and a region is only repainted when what it shows changes, so incoming data repaints
+    # the stream window alone and typing in the controls doesn't wait on it.
+    def renderWindowed(self, page, elements, height: int, width: int, top: int, left: int, pageHeight: int, pageWidth: int, usableHeight: int, usableWidth: int, textspace: int, linespace: int):
+        split = next((i for i, elem in enumerate(elements) if isinstance(elem, Wallbreak)), len(elements))
+        controls, stream = elements[:split], elements[split:]
+
+        controlsLines = sum(elem.displayHeight() for elem in controls)
+        controlsHeight = max(0, min(controlsLines, linespace - bool(stream)))
+        streamHeight = linespace - controlsHeight
 
-                        string = ''
+        regionsTop = top + page.style.margin[0]
 
-                        if currentLine < linespace + self.displayLine:
-                            if (currentLine - self.displayLine == linespace - 1 and currentLine != totalLines - 1) or (currentLine == self.displayLine and self.displayLine != 0):
-                                string = '…'
-                            else:
-                                string = line
+        frameKey = (page, page.title, height, width, top, left, usableHeight, usableWidth, controlsHeight, self.logString)
 
-                                x += [
-                                    elem.style.indent,
-                                    (textspace - len(string)) // 2,
-                                    textspace - len(string) - elem.style.indent
-                                ][elem.style.align.value]
+        if frameKey != self.frameKey:
+            self.frameKey = frameKey
 
-                                unhighlighted_color = (self.style.textColor if not elem.style.color else curses.color_pair(elem.style.color)) | elem.style.weight
+            self.stdscr.erase()
+            self.drawFrame(page, height, width, top, left, pageHeight, pageWidth, usableHeight, usableWidth)
+            self.trystr(0, 0, self.logString, self.style.shadowColor)
+            self.stdscr.noutrefresh()
 
-                        string = ellipsis(string, textspace - elem.style.indent)
+            self.controlsRegion.place(controlsHeight, usableWidth, regionsTop, left, self.style.textColor)
+            self.streamRegion.place(streamHeight, usableWidth, regionsTop + controlsHeight, left, self.style.textColor)
 
-                        if elem is page.highlightedElement:
-                            self.trystr(top + currentLine + page.style.margin[0] - self.displayLine, left + x, string, self.style.highlightedColor | elem.style.weight | curses.A_BOLD)
-                        else:
-                            self.trystr(top + currentLine + page.style.margin[0] - self.displayLine, left + x, string, unhighlighted_color or self.style.textColor | elem.style.weight)
+        self.scrollToHighlighted(page, controlsHeight, controlsLines)
 
-                    currentLine += 1
+        self.controlsRegion.paint(self.elementLines(page, controls, 0, 0, textspace, controlsHeight, self.displayLine))
+        self.streamRegion.paint(self.elementLines(page, stream, 0, 0, textspace, streamHeight, 0))
 
-        self.stdscr.move(0, 0)
-        self.trystr(0, 0, self.logString, self.style.shadowColor)
-         
-        # Refresh the screen
-        self.stdscr.refresh()
+        curses.doupdate()
@@ -0,0 +1,76 @@
+import unicodedata
+
+# How many terminal cells text takes up. Wide East Asian characters (and most emoji) take two, combining
+# marks and other zero width characters take none, everything else takes one. Pure ASCII strings, which
+# is nearly everything, are measured with len(); other characters are looked up once and cached.
+
+# character -> cells, filled in as characters are first seen
+widths = {chr(i): 1 for i in range(128)}
+
+def measure(ch: str):
+    # combining marks, enclosing marks, format characters like ZWJ, and Hangul medial vowels and final consonants
+    if unicodedata.combining(ch) or unicodedata.category(ch) in ('Mn', 'Me', 'Cf') or '\u1160' <= ch <= '\u11ff':
+        return 0
+
+    if unicodedata.east_asian_width(ch) in ('W', 'F'):
+        return 2
+
+    return 1
+
+def charWidth(ch: str):
+    width = widths.get(ch)
+
+    if width is None:
+        width = widths[ch] = measure(ch)
+
+    return width
+
+def textWidth(text: str):
+    if text.isascii():
+        return len(text)
+
+    try:
+        return sum(map(widths.__getitem__, text))
+    except KeyError:
+        for ch in set(text):
+            charWidth(ch)
+
+        return sum(map(widths.__getitem__, text))
+
+# the longest start of text that fits in `cells`
+def truncate(text: str, cells: int):
+    if text.isascii():
+        return text[:max(0, cells)]
+
+    total = 0
+
+    for i, ch in enumerate(text):
+        total += charWidth(ch)
+
+        if total > cells:
+            return text[:i]
+
+    return text
+
+# text cut into pieces no wider than `cells`, a wide character that doesn't fit starts the next piece
+def split(text: str, cells: int):
+    if text.isascii():
+        return [text[i:i + cells] for i in range(0, len(text), cells)] or ['']
+
+    pieces = []
+    start = 0
+    used = 0
+
+    for i, ch in enumerate(text):
+        width = charWidth(ch)
+
+        if used + width > cells and i > start:
+            pieces.append(text[start:i])
+            start = i
+            used = 0
+
+        used += width
+
+    pieces.append(text[start:])
+
+    return pieces
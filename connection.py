@@ -1,76 +1,405 @@
-import serial
+import os
 import time
 import threading
 
+import metrics
+
+from backlog import Backlog
+from decoder import Pipeline
+from recording import Recorder, RX, TX
+from trigger import Trigger
+from transport import openTransport, deviceIdentity, findDevice
+
+rxBytes      = metrics.registry.counter('serial_rx_bytes_total', 'bytes received')
+rxLines      = metrics.registry.counter('serial_rx_lines_total', 'lines received')
+txBytes      = metrics.registry.counter('serial_tx_bytes_total', 'bytes sent')
+txLines      = metrics.registry.counter('serial_tx_lines_total', 'lines sent')
+decodeErrors = metrics.registry.counter('serial_decode_errors_total', 'bytes that could not be decoded')
+reconnects   = metrics.registry.counter('serial_reconnects_total', 'times a supervised connection reopened its device')
+backlog      = metrics.registry.gauge('serial_reader_backlog_bytes', 'bytes waiting in the port when the reader last read')
+outages      = metrics.registry.counter('serial_outages_total', 'times a supervised connection lost its device')
+
+# how long disconnect waits for the reader to finish, one still blocked in a read exits when the read returns
+JOIN_TIMEOUT = 0.5
+
+# transports a supervised connection knows how to reopen
+SUPERVISED = ['serial', 'rfc2217', 'tcp', 'session']
+
+# while the device is gone its return is checked at most this far apart, failed opens back off further
+POLL_MIN = 0.005
+POLL_MAX = 0.05
+RETRY_MAX = 2
+
 def currentTime():
     return int(round(time.time() * 1000))
 
+# Everything one connect opened. A reader only ever uses its own session's objects, so one that's slow to
+# notice it was stopped (still inside a read, say) can't feed the next session's pipeline, backlog or recording.
+class Session:
+    __slots__ = ('transport', 'port', 'ser', 'stopped', 'pipeline', 'backlog', 'recorder', 'trigger', 'thread', 'identity', 'candidate', 'devStamp', 'lost')
+
+    def __init__(self, transport: str, port: str, ser, pipeline, backlog, recorder):
+        self.transport = transport
+        self.port = port
+        self.ser = ser
+        # set when the session ends, only this session's reader watches it
+        self.stopped = threading.Event()
+
+        self.pipeline = pipeline
+        self.backlog = backlog
+        self.recorder = recorder
+        self.trigger = None
+        self.thread = None
+
+        # (vid, pid, serial number) of a supervised usb serial device, so it's found again under any name
+        self.identity = None
+        # where the device was last seen while it's gone, and the state of /dev when the ports were last listed
+        self.candidate = None
+        self.devStamp = None
+        self.lost = False
+
 class SerialConnection:
     def __init__(self):
+        # kind of transport from transport.transports and what to open with it: a device, host:port or a file
+        self.transport = 'serial'
         self.port = None
         self.baudrate = 9600
         self.showTime = False
 
-        self.thread = None
-        self.ser = None
+        # decoder pipeline stages, see decoder.py
+        self.framing = 'none'
+        self.decoder = 'utf-8'
+        self.splitLines = True
+
+        # hardware (RTS/CTS) and software (XON/XOFF) flow control, for transports that support them
+        self.rtscts = False
+        self.xonxoff = False
+
+        # decoded text waiting for the UI, see backlog.py
+        self.backlogHigh = 4 * 1024 * 1024
+        self.backlogLow = 1024 * 1024
+        self.backlogPolicy = 'flow-control'
+        # most text handed to the UI per frame
+        self.drainLimit = 256 * 1024
+
+        # save a capture around any received line matching this regex, see trigger.py
+        self.triggerPattern = None
+        self.triggerPre = 64 * 1024
+        self.triggerPost = 64 * 1024
+        self.triggerDirectory = '.'
+
+        # record the session to this file if set
+        self.recordPath = None
+        # for the replay transport, speed 0 is as fast as possible
+        self.replaySpeed = 1
+
+        # reopen the port when the device goes away and comes back, see recover
+        self.supervised = False
+
+        # set while the reader should read, cleared while output is paused
+        self.outputOn = threading.Event()
+
+        # the current Session and the page it reads into, None until a connect succeeds
+        self.session = None
+        self.page = None
+        # the UI and a running script both send, one write goes out at a time and is recorded in that order
+        self.writeLock = threading.Lock()
+
+        # called with every chunk of decoded text, e.g. a running script's expect
+        self.listeners = []
 
         self.startTime = 0
+
+    @property
+    def output(self):
+        return self.outputOn.is_set()
+
+    @output.setter
+    def output(self, value):
+        if value:
+            self.outputOn.set()
+        else:
+            self.outputOn.clear()
+
+    def open(self, transport: str, port: str):
+        return openTransport(transport, port, self.baudrate, timeout=5, write_timeout=5, replaySpeed=self.replaySpeed, rtscts=self.rtscts, xonxoff=self.xonxoff)
     
     def connect(self, page):
+        # a cached serial page can still own a session, it ends before the new one starts
+        if self.page is not None:
+            self.disconnect(self.page)
+
+        # the recording file is opened first, so a bad path never leaves a port open behind it
         try:
-            self.ser = serial.Serial(self.port, self.baudrate, timeout=5, write_timeout=5)
+            recorder = Recorder(self.recordPath) if self.recordPath else None
+        except OSError as error:
+            self.failed(page, f"Could not record to {self.recordPath}: {error}")
+            return
+
+        try:
+            ser = self.open(self.transport, self.port)
+        # serial.SerialException is an OSError, a bad address or baudrate is a ValueError
+        except (OSError, ValueError) as error:
+            if recorder:
+                recorder.close()
+
+            self.failed(page, f"Could not open {self.port}: {error}")
+            return
+
+        session = Session(self.transport, self.port, ser, Pipeline(self.framing, self.decoder, self.splitLines), Backlog(self.backlogHigh, self.backlogLow, self.backlogPolicy), recorder)
+
+        try:
+            self.page = page
+            self.session = session
+
+            session.identity = deviceIdentity(self.port) if self.supervised and self.transport == 'serial' else None
+
+            if self.triggerPattern:
+                pattern = self.triggerPattern
+                backlog = session.backlog
+
+                session.trigger = Trigger(pattern, self.triggerPre, self.triggerPost, self.triggerDirectory,
+                    lambda path: backlog.put(f"\n[triggered on '{pattern}', capturing to {path}]\n", force=True),
+                    lambda path, size: backlog.put(f"\n[capture of {size} bytes saved to {path}]\n", force=True))
 
-            self.stillAlive = True
             self.output = True
 
-            self.thread = threading.Thread(target=self.readPort, args=[ page ])
-            self.thread.start()
+            session.thread = threading.Thread(target=self.readPort, args=[ page, session ], daemon=True)
+            session.thread.start()
 
             self.startTime = currentTime()
 
-            page.title = self.port
+            page.title = ser.name
 
         except KeyboardInterrupt:
             self.disconnect(page)
 
-    def readPort(self, page):
+    # a connect that didn't get as far as starting a reader, leaves nothing for disconnect to close
+    def failed(self, page, message: str):
+        self.session = None
+
+        page.getElementByID('serial-data').append(message + '\n')
+
+    # waiting text for the UI to show, called once per frame from the UI thread
+    def drain(self):
+        return self.session.backlog.drain(self.drainLimit) if self.session else ''
+
+    # where the session's device can be opened now, or None while it's still gone
+    def locate(self, session):
+        if session.transport != 'serial':
+            return session.port
+
+        if session.identity is None:
+            return session.port if os.path.exists(session.port) else None
+
+        if session.candidate and os.path.exists(session.candidate):
+            return session.candidate
+
+        # listing ports is slow, only do it when something in /dev has come or gone
         try:
+            stamp = os.stat('/dev').st_mtime_ns
+        except OSError:
+            stamp = None
 
-            serialData = page.getElementByID('serial-data')
-            
-            if self.showTime and self.output:
-                serialData.text += "[{}] ".format(format(currentTime() - self.startTime, '07'))
+        if stamp is not None and stamp == session.devStamp:
+            return None
 
-            while self.stillAlive:
-                try:
-                    if self.output:
-                        data = self.ser.read(5).decode('utf-8')
+        session.devStamp = stamp
+        session.candidate = findDevice(session.identity)
 
-                        for char in data:
-                            serialData.text += char
+        return session.candidate
 
-                            if char == '\n' and self.showTime:
-                                serialData.text += "[{}] ".format(format(currentTime() - self.startTime, '07'))
+    # called by the reader when the port fails, waits for the device to come back and reopens it in place so
+    # scrollback, recording, triggers and timestamps carry on. Returns False if the session was ended.
+    def recover(self, page, error, session):
+        lostAt = time.monotonic()
 
-                        if page.displaySize[0] - (3 + page.style.margin[0] * 2) < serialData.displayHeight():
-                            serialData.style.displayIndex += 1
-                    
-                except (UnicodeDecodeError, serial.serialutil.SerialException):
-                    pass
+        session.lost = True
+        session.candidate = None
+        session.devStamp = None
 
-        except serial.SerialTimeoutException:
+        outages.inc()
 
-            serialData.text += 'Serial timeout while trying to receive data.'
+        session.backlog.put(f"\n[{session.ser.name} lost at {time.strftime('%H:%M:%S')}: {error}]\n", force=True)
 
-            self.disconnect(page)
+        try:
+            session.ser.close()
+        except OSError:
+            pass
+
+        delay = POLL_MIN
+
+        while not session.stopped.wait(delay):
+            port = self.locate(session)
+
+            if port is None:
+                delay = min(delay * 2, POLL_MAX)
+                continue
+
+            try:
+                ser = self.open(session.transport, port)
+            except OSError:
+                # it's there but not ready yet, or the address doesn't answer
+                delay = min(delay * 2, RETRY_MAX)
+                continue
+
+            session.ser = ser
+
+            # ended while the port was being opened, disconnect has already closed the old one
+            if session.stopped.is_set():
+                ser.close()
+                return False
+
+            session.lost = False
+
+            reconnects.inc()
+
+            page.title = ser.name
+
+            session.backlog.put(f"[reconnected to {ser.name} after {time.monotonic() - lostAt:.3f} s]\n", force=True)
+
+            return True
+
+        return False
+
+    def timestamp(self):
+        return "[{}] ".format(format(currentTime() - self.startTime, '07'))
+
+    def readPort(self, page, session):
+        serialData = page.getElementByID('serial-data')
+        plot = page.getElementByID('serial-plot')
+
+        stopped = session.stopped
+        pipeline = session.pipeline
+        textBacklog = session.backlog
+        recorder = session.recorder
+        trigger = session.trigger
+
+        if self.showTime and self.output:
+            textBacklog.put(self.timestamp(), force=True)
+
+        decodeErrorsSeen = 0
+
+        while not stopped.is_set():
+            # paused output waits here instead of spinning
+            if not self.outputOn.wait(0.5):
+                continue
+
+            try:
+                # recover can swap in a reopened port, so this one is looked up on every pass
+                ser = session.ser
+
+                waiting = ser.in_waiting
+                backlog.set(waiting)
+
+                # read everything that's waiting so fast links aren't throttled by tiny reads
+                data = ser.read(waiting or 1)
+
+                # a read that was already waiting when the session ended belongs to nobody
+                if not data or stopped.is_set():
+                    continue
+
+                rxBytes.inc(len(data))
+
+                if recorder:
+                    recorder.record(RX, data)
+
+                if trigger:
+                    trigger.feed(data)
+
+                serialData.appendRaw(data)
+
+                text = ''.join(pipeline.feed(data))
+
+                rxLines.inc(text.count('\n'))
+
+                if pipeline.errors != decodeErrorsSeen:
+                    decodeErrors.inc(pipeline.errors - decodeErrorsSeen)
+                    decodeErrorsSeen = pipeline.errors
+
+                # a hidden plot isn't parsed at all, reading shouldn't pay for a view nobody is looking at
+                if plot and plot.style.display:
+                    plot.feed(text)
+
+                for listener in self.listeners:
+                    listener(text)
+
+                if self.showTime and '\n' in text:
+                    text = text.replace('\n', '\n' + self.timestamp())
+
+                if text:
+                    textBacklog.put(text, len(data))
+
+            # the device went away or the other end closed the connection, serial.SerialException is an OSError
+            except OSError as error:
+                if stopped.is_set():
+                    break
+
+                if self.supervised and session.transport in SUPERVISED:
+                    if not self.recover(page, error, session):
+                        break
+                else:
+                    textBacklog.put(f"\n{error}\n", force=True)
+
+                    stopped.set()
         
     def send(self, string):
-        if self.stillAlive:
+        session = self.session
+
+        if session and not session.stopped.is_set():
             # sending the newline is very important
-            self.ser.write((string + '\n').encode('utf-8'))
+            data = (string + '\n').encode('utf-8')
+
+            if session.lost:
+                session.backlog.put(f"[not sent while {session.ser.name} is gone: {string}]\n", force=True)
+                return
+
+            with self.writeLock:
+                try:
+                    session.ser.write(data)
+                except OSError as error:
+                    # the reader notices the port failing and deals with it
+                    session.backlog.put(f"[not sent: {error}]\n", force=True)
+                    return
+
+                if session.recorder:
+                    session.recorder.record(TX, data)
+
+            txBytes.inc(len(data))
+            txLines.inc(string.count('\n') + 1)
     
+    # ends the session `page` reads into, a page that no longer owns the session (e.g. evicted from the
+    # page cache after a newer connect) has nothing to end
     def disconnect(self, page):
-        self.stillAlive = False
-        self.ser.close()
+        if page is not self.page:
+            return
+
+        session = self.session
+
+        self.page = None
+
+        if session is None:
+            return
+
+        session.stopped.set()
+        session.backlog.close()
+
+        ser = session.ser
+
+        # wakes a pyserial read that's waiting for data
+        if hasattr(ser, 'cancel_read'):
+            ser.cancel_read()
+
+        ser.close()
+
+        if session.thread is not threading.current_thread():
+            session.thread.join(JOIN_TIMEOUT)
+
+        if session.recorder:
+            session.recorder.close()
+
+        if session.trigger:
+            session.trigger.close()
 
-        page.getElementByID('serial-data').text += 'Detached from ' + self.ser.name    
+        # after whatever is still waiting to be shown
+        session.backlog.put('Detached from ' + ser.name, force=True)
@@ -0,0 +1,307 @@
+import codecs
+
+# Streaming decoder pipeline for received bytes.
+#
+# Every stage has a feed(chunk) method that returns a list of output chunks. Framers take raw bytes and
+# return complete frames, decoders turn bytes (or frames) into text and text stages work on str. Stages keep
+# partial input in a bytearray between calls and only copy at frame boundaries.
+
+SLIP_END     = 0xC0
+SLIP_ESC     = 0xDB
+SLIP_ESC_END = 0xDC
+SLIP_ESC_ESC = 0xDD
+
+# a frame longer than this is dropped and the framer skips ahead to the next delimiter, so a lost
+# delimiter (or a stream that isn't framed at all) can't make the buffer grow without limit
+MAX_FRAME = 64 * 1024
+
+class Stage:
+    def feed(self, data):
+        return [data]
+
+    def flush(self):
+        return []
+
+class SlipFramer(Stage):
+    def __init__(self, maxFrame: int = MAX_FRAME):
+        self.maxFrame = maxFrame
+        self.buffer = bytearray()
+
+        # skipping the rest of an oversized frame, and how many frames have been dropped
+        self.discarding = False
+        self.dropped = 0
+
+    def feed(self, data):
+        buf = self.buffer
+        buf += data
+
+        frames = []
+        start = 0
+
+        while True:
+            end = buf.find(SLIP_END, start)
+
+            if end == -1:
+                break
+
+            if self.discarding:
+                self.discarding = False
+            elif end - start > self.maxFrame:
+                self.dropped += 1
+            elif end > start:
+                frame = bytes(memoryview(buf)[start:end])
+
+                # escapes always start with ESC, so replacing ESC_END first can't eat a literal byte
+                if SLIP_ESC in frame:
+                    frame = frame.replace(b'\xdb\xdc', b'\xc0').replace(b'\xdb\xdd', b'\xdb')
+
+                frames.append(frame)
+
+            start = end + 1
+
+        if start:
+            del buf[:start]
+
+        if len(buf) > self.maxFrame:
+            if not self.discarding:
+                self.dropped += 1
+                self.discarding = True
+
+            buf.clear()
+
+        return frames
+
+class CobsFramer(Stage):
+    def __init__(self, maxFrame: int = MAX_FRAME):
+        self.maxFrame = maxFrame
+        self.buffer = bytearray()
+
+        # skipping the rest of an oversized frame, and how many frames have been dropped
+        self.discarding = False
+        self.dropped = 0
+
+    @staticmethod
+    def decode(frame):
+        out = bytearray()
+        view = memoryview(frame)
+        length = len(frame)
+        i = 0
+
+        while i < length:
+            code = view[i]
+
+            if code == 0:
+                break
+
+            out += view[i + 1:i + code]
+            i += code
+
+            if code < 0xFF and i < length:
+                out.append(0)
+
+        return bytes(out)
+
+    def feed(self, data):
+        buf = self.buffer
+        buf += data
+
+        frames = []
+        start = 0
+
+        while True:
+            end = buf.find(0, start)
+
+            if end == -1:
+                break
+
+            if self.discarding:
+                self.discarding = False
+            elif end - start > self.maxFrame:
+                self.dropped += 1
+            elif end > start:
+                frames.append(CobsFramer.decode(memoryview(buf)[start:end]))
+
+            start = end + 1
+
+        if start:
+            del buf[:start]
+
+        if len(buf) > self.maxFrame:
+            if not self.discarding:
+                self.dropped += 1
+                self.discarding = True
+
+            buf.clear()
+
+        return frames
+
+class LengthPrefixFramer(Stage):
+    def __init__(self, headerSize: int = 2, byteorder: str = 'big'):
+        self.headerSize = headerSize
+        self.byteorder = byteorder
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        buf = self.buffer
+        buf += data
+
+        frames = []
+        view = memoryview(buf)
+        pos = 0
+
+        while len(buf) - pos >= self.headerSize:
+            length = int.from_bytes(view[pos:pos + self.headerSize], self.byteorder)
+            end = pos + self.headerSize + length
+
+            if end > len(buf):
+                break
+
+            frames.append(bytes(view[pos + self.headerSize:end]))
+            pos = end
+
+        view.release()
+
+        if pos:
+            del buf[:pos]
+
+        return frames
+
+class Utf8Decoder(Stage):
+    def __init__(self, framed: bool = False):
+        self.framed = framed
+        self.decoder = codecs.getincrementaldecoder('utf-8')('replace')
+        self.errors = 0
+
+    def feed(self, data):
+        if self.framed:
+            text = str(data, 'utf-8', 'replace') + '\n'
+        else:
+            text = self.decoder.decode(data)
+
+        if '�' in text:
+            self.errors += text.count('�')
+
+        return [text] if text else []
+
+    def flush(self):
+        text = self.decoder.decode(b'', True)
+
+        return [text] if text else []
+
+class HexDecoder(Stage):
+    # unframed bytes are shown `rowSize` to a line, a row left part way through is carried on by the next chunk
+    def __init__(self, framed: bool = False, rowSize: int = 16):
+        self.framed = framed
+        self.rowSize = rowSize
+        # bytes already on the row being written
+        self.column = 0
+
+    def feed(self, data):
+        if self.framed:
+            return [bytes(data).hex(' ') + '\n']
+
+        if not len(data):
+            return []
+
+        data = bytes(data)
+        pieces = []
+        pos = 0
+
+        while pos < len(data):
+            take = min(len(data) - pos, self.rowSize - self.column)
+
+            pieces.append((' ' if self.column else '') + data[pos:pos + take].hex(' '))
+
+            self.column += take
+            pos += take
+
+            if self.column == self.rowSize:
+                pieces.append('\n')
+                self.column = 0
+
+        return [''.join(pieces)]
+
+class LineSplitter(Stage):
+    def __init__(self):
+        self.pendingCR = False
+
+    def feed(self, text):
+        if self.pendingCR:
+            text = '\r' + text
+            self.pendingCR = False
+
+        if text.endswith('\r'):
+            text = text[:-1]
+            self.pendingCR = True
+
+        if '\r' in text:
+            text = text.replace('\r\n', '\n').replace('\r', '')
+
+        if not text:
+            return []
+
+        lines = text.split('\n')
+        last = lines.pop()
+        pieces = [line + '\n' for line in lines]
+
+        if last:
+            pieces.append(last)
+
+        return pieces
+
+framers = {
+    'none': None,
+    'slip': SlipFramer,
+    'cobs': CobsFramer,
+    'length-prefixed': LengthPrefixFramer
+}
+
+decoders = {
+    'utf-8': Utf8Decoder,
+    'hex': HexDecoder
+}
+
+# factory is called with framed=True/False and must return a Stage turning bytes into str
+def registerDecoder(name: str, factory):
+    decoders[name] = factory
+
+def registerFramer(name: str, factory):
+    framers[name] = factory
+
+class Pipeline:
+    def __init__(self, framing: str = 'none', decoder: str = 'utf-8', splitLines: bool = True):
+        self.stages = []
+
+        framer = framers.get(framing)
+
+        if framer:
+            self.stages.append(framer())
+
+        self.decoder = decoders[decoder](framed=framer is not None)
+        self.stages.append(self.decoder)
+
+        if splitLines:
+            self.stages.append(LineSplitter())
+
+    @property
+    def errors(self):
+        return getattr(self.decoder, 'errors', 0)
+
+    def feed(self, data):
+        chunks = [data]
+
+        for stage in self.stages:
+            if len(chunks) == 1:
+                chunks = stage.feed(chunks[0])
+            else:
+                out = []
+
+                for chunk in chunks:
+                    out.extend(stage.feed(chunk))
+
+                chunks = out
+
+            if not chunks:
+                break
+
+        return chunks
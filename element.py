@@ -1,14 +1,23 @@
 import curses
+import threading
 
+from array import array
+from bisect import bisect_left
 from copy import deepcopy
 from enum import Enum
 
+from cellwidth import textWidth
+from event import Event
+from wrapindex import WrapIndex, wrapLine, wrappedRows
+
 class Align(Enum):
     LEFT   = 0
     CENTER = 1
     RIGHT  = 2
 
 class Style:
+    __slots__ = ('color', 'align', 'weight', 'indent', 'display', 'height', 'displayIndex')
+
     def __init__(self, color = None, align: Align = Align.LEFT, weight = curses.A_NORMAL, indent: int = 0, display = True, height = None, displayIndex: int = 0):
         self.color = color
         self.align = align
@@ -18,26 +27,79 @@ class Style:
         self.height = height
         self.displayIndex = displayIndex
 
+    # interned frozen styles, keyed by their overrides
+    interned = {}
+
+    @staticmethod
+    def intern(**overrides):
+        key = tuple(sorted(overrides.items()))
+        style = Style.interned.get(key)
+
+        if style is None:
+            style = Style.interned[key] = FrozenStyle(**overrides)
+
+        return style
+
+    def mutable(self):
+        return Style(self.color, self.align, self.weight, self.indent, self.display, self.height, self.displayIndex)
+
+    def copy(self):
+        return self.mutable()
+
+# a style shared between elements, Element.setStyle/ownStyle give an element its own copy before changing it
+class FrozenStyle(Style):
+    __slots__ = ()
+
+    def __init__(self, **overrides):
+        style = Style(**overrides)
+
+        for name in Style.__slots__:
+            object.__setattr__(self, name, getattr(style, name))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"can't set '{name}' on a shared style, use Element.setStyle")
+
+    def copy(self):
+        return self
+
+Style.DEFAULT = Style.intern()
+
 class Element:
-    def __init__(self, text: str = '', style: Style = Style(), ID: str = '', classList: list = [], data: dict = {}, onrefresh = None, onload = None, onunload = None):
+    __slots__ = ('text', 'style', 'ID', 'classList', 'onload', 'onunload', 'onrefresh', 'page', 'cdom', 'data')
+
+    def __init__(self, text: str = '', style: Style = None, ID: str = '', classList: list = None, data: dict = None, onrefresh = None, onload = None, onunload = None):
         self.text = text
-        self.style = style
+        self.style = Style.DEFAULT if style is None else style
         self.ID = ID
-        self.classList = classList
+        self.classList = [] if classList is None else classList
         self.onload = onload
         self.onunload = onunload
         self.onrefresh = onrefresh
         self.page = None
+        self.cdom = None
 
-        self.data = data
+        self.data = {} if data is None else data
+
+    # make sure this element's style isn't shared before changing it
+    def ownStyle(self):
+        if isinstance(self.style, FrozenStyle):
+            self.style = self.style.mutable()
+
+        return self.style
+
+    def setStyle(self, **overrides):
+        style = self.ownStyle()
+
+        for name, value in overrides.items():
+            setattr(style, name, value)
     
     def copy(self):
         return Element(
             text=self.text[:],
-            style=deepcopy(self.style),
+            style=self.style.copy(),
             ID=self.ID[:],
             classList=self.classList[:],
-            data=deepcopy(self.data),
+            data=deepcopy(self.data) if self.data else None,
             onload=self.onload,
             onunload=self.onunload,
             onrefresh=self.onrefresh
@@ -68,9 +130,11 @@ class Element:
         return self.style.height or len(self.lines())
 
     def displayWidth(self):
-        return len(self.getText())
+        return textWidth(self.getText())
 
 class Break(Element):
+    __slots__ = ()
+
     def __init__(self, ID: str = ''):
         super().__init__(ID=ID)
 
@@ -78,6 +142,8 @@ class Break(Element):
         return Break(ID=self.ID[:])
 
 class Linebreak(Element):
+    __slots__ = ('char',)
+
     def __init__(self, char: str = '━', ID: str = ''):
         super().__init__(ID=ID)
 
@@ -90,6 +156,8 @@ class Linebreak(Element):
         return Linebreak(ID=self.ID[:], char=self.char[:])
 
 class Wallbreak(Linebreak):
+    __slots__ = ()
+
     def __init__(self, ID: str = ''):
         super().__init__(ID=ID, char='═')
 
@@ -97,6 +165,8 @@ class Wallbreak(Linebreak):
         return Wallbreak(ID=self.ID[:])
 
 class ThinWallbreak(Linebreak):
+    __slots__ = ()
+
     def __init__(self, ID: str = ''):
         super().__init__(ID=ID, char='─')
 
@@ -104,7 +174,12 @@ class ThinWallbreak(Linebreak):
         return ThinWallbreak(ID=self.ID[:])
 
 class Selectable(Element):
-    def __init__(self, text: str = '', style: Style = Style(), ID: str = '', classList: list = [], data: dict = {}, onrefresh = None, onload = None, onunload = None, onkey = None, onselect = None):
+    __slots__ = ('onkey', 'onselect')
+
+    # key name -> method name, merged down the class hierarchy by keymap.classBindings
+    keymap = {}
+
+    def __init__(self, text: str = '', style: Style = None, ID: str = '', classList: list = None, data: dict = None, onrefresh = None, onload = None, onunload = None, onkey = None, onselect = None):
         super().__init__(text, style, ID, classList, data, onrefresh, onload, onunload)
 
         self.onkey = onkey
@@ -113,19 +188,40 @@ class Selectable(Element):
     def copy(self):
         return Selectable(
             text=self.text[:],
-            style=deepcopy(self.style),
+            style=self.style.copy(),
             ID=self.ID[:],
             classList=self.classList[:],
-            data=deepcopy(self.data),
+            data=deepcopy(self.data) if self.data else None,
             onload=self.onload,
             onunload=self.onunload,
             onkey=self.onkey,
             onrefresh=self.onrefresh,
             onselect=self.onselect
         )
+
+    # what enter does once the element has had its say about the key
+    def activate(self, e = None):
+        if self.onselect:
+            e = Event()
+
+            self.onselect(self, e)
+
+            if e.canceled:
+                return
+
+        self.defaultOnselect()
+
+    def defaultOnselect(self):
+        pass
     
 class Link(Selectable):
-    def __init__(self, label: str = '', style: Style = Style(), ID: str = '', classList: list = [], data: dict = {}, onrefresh = None, onload = None, onunload = None, onkey = None, onselect = None, url: str = ''):
+    __slots__ = ('label', 'url')
+
+    keymap = {
+        'right': 'follow'
+    }
+
+    def __init__(self, label: str = '', style: Style = None, ID: str = '', classList: list = None, data: dict = None, onrefresh = None, onload = None, onunload = None, onkey = None, onselect = None, url: str = ''):
         super().__init__('', style, ID, classList, data, onrefresh, onload, onunload, onkey, onselect)
 
         self.label = label
@@ -134,10 +230,10 @@ class Link(Selectable):
     def copy(self):
         return Link(
             label=self.label[:],
-            style=deepcopy(self.style),
+            style=self.style.copy(),
             ID=self.ID[:],
             classList=self.classList[:],
-            data=deepcopy(self.data),
+            data=deepcopy(self.data) if self.data else None,
             onload=self.onload,
             onunload=self.onunload,
             onkey=self.onkey,
@@ -149,11 +245,44 @@ class Link(Selectable):
     def defaultOnload(self):
         self.updateText()
 
+    # onselect runs before leaving so it can set up the next page, or cancel by calling e.preventDefault()
+    def activate(self, e = None):
+        if self.onselect:
+            event = Event()
+
+            self.onselect(self, event)
+
+            if event.canceled:
+                return
+
+        self.cdom.goToPage(self.url)
+
+    # right arrow opens a link instead of going forward in history
+    def follow(self, e):
+        self.activate()
+
+        e.preventDefault()
+
     def updateText(self):
         self.text = self.label + ' → '
 
 class Input(Selectable):
-    def __init__(self, text: str = '', style: Style = Style(), ID: str = '', classList: list = [], data: dict = {}, onrefresh = None, onload = None, onunload = None, onkey = None, onselect = None, value = '', label = '', boxed = True, selected = False):
+    __slots__ = ('selected', 'value', 'label', 'boxed', 'onpaste')
+
+    # pasted text is sent to elements that take text
+    takesText = True
+
+    # 'printable' matches any key that types a character
+    keymap = {
+        'enter': 'toggleEditing',
+        'escape': 'stopEditing',
+        'backspace': 'deleteChar',
+        'printable': 'insertChar',
+        'left': 'keepKey',
+        'right': 'keepKey'
+    }
+
+    def __init__(self, text: str = '', style: Style = None, ID: str = '', classList: list = None, data: dict = None, onrefresh = None, onload = None, onunload = None, onkey = None, onselect = None, value = '', label = '', boxed = True, selected = False, onpaste = None):
         super().__init__(text, style, ID, classList, data, onrefresh, onload, onunload, onkey, onselect)
 
         self.selected = selected
@@ -162,14 +291,15 @@ class Input(Selectable):
         self.boxed = boxed
         self.onrefresh = onrefresh
         self.onkey = onkey
+        self.onpaste = onpaste
 
     def copy(self):
         return Input(
             text=self.text[:],
-            style=deepcopy(self.style),
+            style=self.style.copy(),
             ID=self.ID[:],
             classList=self.classList[:],
-            data=deepcopy(self.data),
+            data=deepcopy(self.data) if self.data else None,
             onload=self.onload,
             onunload=self.onunload,
             onkey=self.onkey,
@@ -178,35 +308,47 @@ class Input(Selectable):
             value=self.value[:] if type(self.value) is str else self.value,
             label=self.label[:],
             boxed=self.boxed,
-            selected=self.selected
+            selected=self.selected,
+            onpaste=self.onpaste
         )
 
     def defaultOnrefresh(self):
         self.updateText()
 
-        if self.selected:
-            self.style.weight = curses.A_UNDERLINE
-        else:
-            self.style.weight = curses.A_NORMAL
+        weight = curses.A_UNDERLINE if self.selected else curses.A_NORMAL
+
+        if self.style.weight != weight:
+            self.setStyle(weight=weight)
 
-    def defaultOnkey(self, e):
-        k = e.key
+    def toggleEditing(self, e):
+        self.selected = not self.selected
+        self.updateText()
 
+    def stopEditing(self, e):
         if self.selected:
-            char = curses.keyname(k).decode('utf-8')
+            self.selected = False
+            self.updateText()
 
-            # e.preventDefault()
+    # while a field is being edited left and right don't reach the page's back/forward, so an arrow pressed
+    # while typing can't navigate away in the middle of an edit
+    def keepKey(self, e):
+        if self.selected:
+            e.preventDefault()
 
-            if len(char) == 1:
-                self.value += char
+    def insertChar(self, e):
+        if self.selected:
+            self.value += e.name
+            self.updateText()
 
-            if k == curses.KEY_BACKSPACE:
-                self.value = self.value[:-1]
-            elif k == 27:
-                self.selected = False
-        
-        if k == curses.KEY_ENTER or k == 10 or k == 13:
-            self.selected = not self.selected
+    def deleteChar(self, e):
+        if self.selected:
+            self.value = self.value[:-1]
+            self.updateText()
+
+    # a whole pasted block arrives at once, inputs are single line so line breaks become spaces
+    def defaultOnpaste(self, e):
+        self.value += ' '.join(e.text.splitlines())
+        self.selected = True
 
         self.updateText()
     
@@ -214,22 +356,36 @@ class Input(Selectable):
         self.text = f"{self.label}{': ' * (self.label != '')}{'[' * self.boxed}{self.value}{']' * self.boxed}"
 
 class Dropdown(Input):
-    def __init__(self, text: str = '', style: Style = Style(), ID: str = '', classList: list = [], data: dict = {}, onrefresh = None, onload = None, onunload = None, onkey = None, onselect = None, value = '', label = '', boxed = True, valueList=[]):
+    __slots__ = ('valueList',)
+
+    takesText = False
+
+    # '*' matches any key without a binding of its own
+    keymap = {
+        'down': 'nextValue',
+        'up': 'previousValue',
+        'backspace': 'ignoreKey',
+        'printable': 'ignoreKey',
+        '*': 'ignoreKey'
+    }
+
+    def __init__(self, text: str = '', style: Style = None, ID: str = '', classList: list = None, data: dict = None, onrefresh = None, onload = None, onunload = None, onkey = None, onselect = None, value = '', label = '', boxed = True, valueList: list = None):
         super().__init__(text, style, ID, classList, data, onrefresh, onload, onunload, onkey, onselect, value, label, boxed)
 
+        self.valueList = [] if valueList is None else valueList
+
         if value == '':
-            self.value = valueList[0]
-        
-        self.valueList = valueList
+            self.value = self.valueList[0]
+
         self.onkey = onkey
 
     def copy(self):
         return Dropdown(
             text=self.text[:],
-            style=deepcopy(self.style),
+            style=self.style.copy(),
             ID=self.ID[:],
             classList=self.classList[:],
-            data=deepcopy(self.data),
+            data=deepcopy(self.data) if self.data else None,
             onload=self.onload,
             onunload=self.onunload,
             onkey=self.onkey,
@@ -241,36 +397,44 @@ class Dropdown(Input):
             valueList=self.valueList[:]
         )
 
-    def defaultOnkey(self, e):
-        k = e.key
+    # while open, every key belongs to the dropdown
+    def toggleEditing(self, e):
+        if self.selected:
+            e.preventDefault()
+
+        super().toggleEditing(e)
 
+    def stopEditing(self, e):
         if self.selected:
             e.preventDefault()
 
-            if k == curses.KEY_DOWN:
-                i = self.valueList.index(self.value)
-
-                if i == len(self.valueList) - 1:
-                    i = -1
-                
-                self.value = self.valueList[i + 1]
-            elif k == curses.KEY_UP:
-                i = self.valueList.index(self.value)
-
-                if i == 0:
-                    i = len(self.valueList)
-                
-                self.value = self.valueList[i - 1]
-            elif k == 27:
-                self.selected = False
-        
-        if k == curses.KEY_ENTER or k == 10 or k == 13:
-            self.selected = not self.selected
+        super().stopEditing(e)
 
-        self.updateText()
+    def nextValue(self, e):
+        if self.selected:
+            e.preventDefault()
+
+            self.value = self.valueList[(self.valueList.index(self.value) + 1) % len(self.valueList)]
+            self.updateText()
+
+    def previousValue(self, e):
+        if self.selected:
+            e.preventDefault()
+
+            self.value = self.valueList[self.valueList.index(self.value) - 1]
+            self.updateText()
+
+    def ignoreKey(self, e):
+        if self.selected:
+            e.preventDefault()
+
+    def defaultOnpaste(self, e):
+        pass
 
 class Checkbox(Selectable):
-    def __init__(self, label: str = '', style: Style = Style(), ID: str = '', classList: list = [], data: dict = {}, onrefresh = None, onload = None, onunload = None, onkey = None, onselect = None, checked = False):
+    __slots__ = ('checked', 'label')
+
+    def __init__(self, label: str = '', style: Style = None, ID: str = '', classList: list = None, data: dict = None, onrefresh = None, onload = None, onunload = None, onkey = None, onselect = None, checked = False):
         super().__init__('', style, ID, classList, data, onrefresh, onload, onunload, onkey, onselect)
 
         self.checked = checked
@@ -288,10 +452,10 @@ class Checkbox(Selectable):
     def copy(self):
         return Checkbox(
             label=self.label[:],
-            style=deepcopy(self.style),
+            style=self.style.copy(),
             ID=self.ID[:],
             classList=self.classList[:],
-            data = deepcopy(self.data),
+            data=deepcopy(self.data) if self.data else None,
             onrefresh=self.onrefresh,
             onload=self.onload,
             onunload=self.onunload,
@@ -302,3 +466,335 @@ class Checkbox(Selectable):
 
     def updateText(self):
         self.text = f"{self.label}: [{'✓' if self.checked else ' '}]"
+
+# maps every byte that isn't printable ascii to '.' for the ascii column of the hex view
+HEX_PRINTABLE = bytes(b if 0x20 <= b < 0x7F else 0x2E for b in range(256))
+
+class Stream(Element):
+    __slots__ = ('mode', 'raw', 'rawOffset', 'rawLimit', 'buffer', 'lineOffset', 'maxLines', 'lock', 'follow', 'rows', 'width', 'include', 'exclude', 'matches', 'pending', 'generation', 'wrap', 'wrapIndex', 'wrapGeneration')
+
+    HEX_ROW = 16
+    # longer lines are broken, so a device that never sends a newline can't grow the last line without limit
+    MAX_LINE = 64 * 1024
+
+    def __init__(self, style: Style = None, ID: str = '', classList: list = None, data: dict = None, onrefresh = None, onload = None, onunload = None, mode: str = 'text', rawLimit: int = 64 * 1024 * 1024, wrap: bool = False, maxLines: int = 100000):
+        super().__init__('', style, ID, classList, data, onrefresh, onload, onunload)
+
+        # the stream scrolls itself, so it always needs its own style
+        self.ownStyle()
+
+        # 'text' shows decoded lines, 'hex' shows an offset/hex/ascii dump of the raw bytes
+        self.mode = mode
+
+        # raw received bytes, rawOffset is the session offset of raw[0] once old data is trimmed
+        self.raw = bytearray()
+        self.rawOffset = 0
+        self.rawLimit = rawLimit
+
+        # logical lines, the last one is still being received. Past maxLines the oldest are dropped and
+        # lineOffset counts them, so buffer[0] is line lineOffset of the session
+        self.buffer = ['']
+        self.lineOffset = 0
+        self.maxLines = maxLines
+        self.lock = threading.Lock()
+
+        self.follow = True
+        self.rows = 1
+        self.width = 1
+
+        self.include = None
+        self.exclude = None
+
+        # session line numbers (lineOffset based) of complete lines that pass the filter, None when unfiltered
+        self.matches = None
+        # matches for lines that arrive while a background scan is running
+        self.pending = None
+        self.generation = 0
+
+        # soft wrap, displayIndex counts screen rows instead of lines while it's on
+        self.wrap = wrap
+        # row counts of the current view, brought up to date lazily when rendering
+        self.wrapIndex = None
+        self.wrapGeneration = 0
+
+    def copy(self):
+        return Stream(
+            style=self.style.copy(),
+            ID=self.ID[:],
+            classList=self.classList[:],
+            data=deepcopy(self.data) if self.data else None,
+            onrefresh=self.onrefresh,
+            onload=self.onload,
+            onunload=self.onunload,
+            mode=self.mode,
+            rawLimit=self.rawLimit,
+            wrap=self.wrap,
+            maxLines=self.maxLines
+        )
+
+    def appendRaw(self, data):
+        with self.lock:
+            self.raw += data
+
+            if len(self.raw) > self.rawLimit:
+                # trim whole rows so offsets stay aligned
+                excess = len(self.raw) - self.rawLimit
+                excess += -excess % Stream.HEX_ROW
+
+                del self.raw[:excess]
+                self.rawOffset += excess
+
+    def append(self, text: str):
+        pieces = text.split('\n')
+        limit = Stream.MAX_LINE
+
+        with self.lock:
+            start = len(self.buffer) - 1
+            pieces[0] = self.buffer[-1] + pieces[0]
+
+            if any(len(piece) > limit for piece in pieces):
+                pieces = [piece[i:i + limit] for piece in pieces for i in range(0, len(piece) or 1, limit)]
+
+            self.buffer[-1:] = pieces
+
+            if len(pieces) > 1:
+
+                if self.matches is not None:
+                    matched = self.matchLines(self.buffer[start:-1], self.lineOffset + start, self.include, self.exclude)
+                    (self.matches if self.pending is None else self.pending).extend(matched)
+
+                if len(self.buffer) - self.maxLines > self.maxLines // 4:
+                    self.trimLines(len(self.buffer) - self.maxLines)
+
+    # drops the oldest `excess` lines, only once a quarter of maxLines has built up so the cost is spread over
+    # many appends. Matches, the wrap index and the scroll position all move with the lines.
+    def trimLines(self, excess: int):
+        del self.buffer[:excess]
+        self.lineOffset += excess
+
+        # how many lines of the current view went
+        if self.matches is None:
+            gone = excess
+        else:
+            gone = bisect_left(self.matches, self.lineOffset)
+            del self.matches[:gone]
+
+            if self.pending is not None:
+                del self.pending[:bisect_left(self.pending, self.lineOffset)]
+
+        index = self.wrapIndex
+
+        if self.wrap and index is not None and len(index) >= gone:
+            self.style.displayIndex = max(0, self.style.displayIndex - index.prefix(gone))
+            index.dropFront(gone)
+        else:
+            # not in use, or too far behind to be worth keeping, syncWrap measures again when it's needed
+            self.wrapIndex = None
+            self.style.displayIndex = max(0, self.style.displayIndex - gone)
+
+    def clear(self):
+        with self.lock:
+            self.buffer = ['']
+            self.lineOffset = 0
+            self.raw = bytearray()
+            self.rawOffset = 0
+            self.style.displayIndex = 0
+            self.generation += 1
+
+            if self.matches is not None:
+                self.matches = array('L')
+                self.pending = None
+
+    # indices of the lines that pass the filter, `first` is the index of lines[0]
+    @staticmethod
+    def matchLines(lines: list, first: int, include, exclude):
+        return array('L', [
+            first + i for i, line in enumerate(lines)
+            if (include is None or include.search(line)) and (exclude is None or not exclude.search(line))
+        ])
+
+    def matchesLine(self, line: str):
+        return (self.include is None or self.include.search(line)) and (self.exclude is None or not self.exclude.search(line))
+
+    # include/exclude are compiled patterns or None, rescans existing lines in the background
+    def setFilter(self, include = None, exclude = None):
+        with self.lock:
+            self.generation += 1
+            self.include = include
+            self.exclude = exclude
+            self.style.displayIndex = 0
+
+            if include is None and exclude is None:
+                self.matches = None
+                self.pending = None
+                return
+
+            self.matches = array('L')
+            self.pending = array('L')
+
+            generation = self.generation
+            start = self.lineOffset
+            end = self.lineOffset + len(self.buffer) - 1
+
+        threading.Thread(target=self.scan, args=[ generation, start, end, include, exclude ], daemon=True).start()
+
+    # each chunk is copied under the lock and matched outside it, a clear or new filter while it's being
+    # matched bumps the generation and the result is thrown away. start and end are session line numbers,
+    # lines trimmed from the front in the meantime are skipped.
+    def scan(self, generation: int, start: int, end: int, include, exclude, chunk: int = 4096):
+        for chunkStart in range(start, end, chunk):
+            stop = min(end, chunkStart + chunk)
+
+            with self.lock:
+                if generation != self.generation:
+                    return
+
+                first = max(chunkStart, self.lineOffset)
+
+                if first >= stop:
+                    continue
+
+                lines = self.buffer[first - self.lineOffset:stop - self.lineOffset]
+
+            matched = self.matchLines(lines, first, include, exclude)
+
+            with self.lock:
+                if generation != self.generation:
+                    return
+
+                if matched and matched[0] < self.lineOffset:
+                    del matched[:bisect_left(matched, self.lineOffset)]
+
+                self.matches.extend(matched)
+
+        with self.lock:
+            if generation == self.generation:
+                self.matches.extend(self.pending)
+                self.pending = None
+
+    def hexLines(self, start: int, end: int):
+        raw = self.raw
+        lines = []
+
+        for row in range(start, end):
+            chunk = raw[row * Stream.HEX_ROW:(row + 1) * Stream.HEX_ROW]
+
+            if not chunk:
+                break
+
+            lines.append(f"{self.rawOffset + row * Stream.HEX_ROW:08x}  {chunk[:8].hex(' '):<23}  {chunk[8:].hex(' '):<23}  |{chunk.translate(HEX_PRINTABLE).decode('ascii')}|")
+
+        return lines
+
+    # number of complete lines in the current, possibly filtered, view
+    def viewLength(self):
+        return len(self.buffer) - 1 if self.matches is None else len(self.matches)
+
+    def viewLine(self, i: int):
+        return self.buffer[i] if self.matches is None else self.buffer[self.matches[i] - self.lineOffset]
+
+    # the line still being received, or None if the filter hides it
+    def tailLine(self):
+        line = self.buffer[-1]
+
+        return line if self.matches is None or self.matchesLine(line) else None
+
+    # only lines added since the last call are measured, a resize or new filter starts over
+    def syncWrap(self):
+        index = self.wrapIndex
+
+        if index is None or index.width != self.width or self.wrapGeneration != self.generation:
+            index = self.wrapIndex = WrapIndex(self.width)
+            self.wrapGeneration = self.generation
+
+        length = self.viewLength()
+
+        if len(index) < length:
+            index.extend(self.viewLine(i) for i in range(len(index), length))
+
+    def setWrap(self, wrap: bool):
+        with self.lock:
+            if wrap == self.wrap:
+                return
+
+            self.syncWrap()
+
+            # keep the same text at the top when switching between lines and rows
+            if wrap:
+                self.style.displayIndex = self.wrapIndex.prefix(min(self.style.displayIndex, len(self.wrapIndex)))
+            else:
+                self.style.displayIndex = self.wrapIndex.find(self.style.displayIndex)[0]
+
+            self.wrap = wrap
+
+    def wrappedLines(self, start: int, count: int):
+        index = self.wrapIndex
+        line, offset = index.find(start)
+        lines = []
+
+        while len(lines) < count and line < len(index):
+            lines.extend(wrapLine(self.viewLine(line), self.width)[offset:offset + count - len(lines)])
+            offset = 0
+            line += 1
+
+        tail = self.tailLine()
+
+        if len(lines) < count and tail is not None:
+            skip = max(0, start - index.total())
+            lines.extend(wrapLine(tail, self.width)[skip:skip + count - len(lines)])
+
+        return lines
+
+    def lineCount(self):
+        if self.mode == 'hex':
+            return -(-len(self.raw) // Stream.HEX_ROW)
+
+        if self.wrap:
+            with self.lock:
+                self.syncWrap()
+                tail = self.tailLine()
+
+                return self.wrapIndex.total() + (wrappedRows(tail, self.width) if tail is not None else 0)
+
+        if self.matches is None:
+            return len(self.buffer)
+
+        return len(self.matches) + bool(self.matchesLine(self.buffer[-1]))
+
+    def lines(self):
+        start = self.style.displayIndex
+        end = start + self.rows
+
+        with self.lock:
+            if self.mode == 'hex':
+                return self.hexLines(start, end)
+
+            if self.wrap:
+                self.syncWrap()
+                return self.wrappedLines(start, self.rows)
+
+            if self.matches is None:
+                return self.buffer[start:end]
+
+            offset = self.lineOffset
+            lines = [self.buffer[i - offset] for i in self.matches[start:end]]
+
+            if len(lines) < self.rows and self.matchesLine(self.buffer[-1]):
+                lines.append(self.buffer[-1])
+
+            return lines
+
+    def displayHeight(self):
+        return self.style.height or max(1, len(self.lines()))
+
+    def displayWidth(self):
+        return max((textWidth(line) for line in self.lines()), default=0)
+
+    def defaultOnrefresh(self):
+        others = sum(elem.displayHeight() for elem in self.page.elements if elem is not self and elem.style.display)
+
+        self.rows = max(1, self.page.displaySize[0] - self.page.style.margin[0] * 2 - others)
+        self.width = max(1, self.page.displaySize[1] - self.page.style.margin[1] * 2 - self.style.indent)
+
+        if self.follow:
+            self.style.displayIndex = max(0, self.lineCount() - self.rows)
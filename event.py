@@ -1,6 +1,49 @@
 import curses
 
+# key code -> the name used in key bindings, printable characters are named by themselves
+KEY_NAMES = {
+    curses.KEY_UP: 'up',
+    curses.KEY_DOWN: 'down',
+    curses.KEY_LEFT: 'left',
+    curses.KEY_RIGHT: 'right',
+    curses.KEY_PPAGE: 'pageup',
+    curses.KEY_NPAGE: 'pagedown',
+    curses.KEY_HOME: 'home',
+    curses.KEY_END: 'end',
+    curses.KEY_IC: 'insert',
+    curses.KEY_DC: 'delete',
+    curses.KEY_BTAB: 'shift-tab',
+    curses.KEY_ENTER: 'enter',
+    10: 'enter',
+    13: 'enter',
+    9: 'tab',
+    27: 'escape',
+    curses.KEY_BACKSPACE: 'backspace',
+    127: 'backspace',
+    8: 'backspace'
+}
+
+KEY_NAMES.update({i: chr(i) for i in range(32, 127)})
+KEY_NAMES.update({i: 'ctrl-' + chr(i + 96) for i in range(1, 27) if i not in KEY_NAMES})
+KEY_NAMES.update({curses.KEY_F0 + i: f"f{i}" for i in range(1, 13)})
+
+def keyName(key: int):
+    name = KEY_NAMES.get(key)
+
+    if name is None:
+        # anything else keeps curses' name, looked up once
+        try:
+            name = curses.keyname(key).decode('utf-8', 'replace')
+        except (curses.error, ValueError):
+            name = str(key)
+
+        KEY_NAMES[key] = name
+
+    return name
+
 class Event():
+    __slots__ = ('canceled',)
+
     def __init__(self):
         self.canceled = False
 
@@ -8,11 +51,22 @@ class Event():
         self.canceled = True
 
 class KeyEvent(Event):
+    __slots__ = ('key', 'name')
+
     def __init__(self, key):
         super().__init__()
 
         self.key = key
+        self.name = keyName(key)
     
     @staticmethod
     def isEnter(key):
-        return (key == curses.KEY_ENTER or key == 10 or key == 13)
\ No newline at end of file
+        return (key == curses.KEY_ENTER or key == 10 or key == 13)
+
+class PasteEvent(Event):
+    __slots__ = ('text',)
+
+    def __init__(self, text):
+        super().__init__()
+
+        self.text = text
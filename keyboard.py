@@ -0,0 +1,78 @@
+import sys
+
+from event import KeyEvent, PasteEvent
+
+# terminals wrap pasted text in these sequences once bracketed paste is turned on
+PASTE_START = [27, 91, 50, 48, 48, 126] # ESC [ 2 0 0 ~
+PASTE_END   = [27, 91, 50, 48, 49, 126] # ESC [ 2 0 1 ~
+
+def enableBracketedPaste():
+    sys.stdout.write('\x1b[?2004h')
+    sys.stdout.flush()
+
+def disableBracketedPaste():
+    sys.stdout.write('\x1b[?2004l')
+    sys.stdout.flush()
+
+class KeyReader:
+    def __init__(self, stdscr):
+        self.stdscr = stdscr
+
+        # bytes of a paste whose end marker hasn't arrived yet
+        self.paste = None
+        # keys that might be the start of a paste marker split across reads
+        self.pending = []
+
+    # drain every key that's waiting and turn them into KeyEvents and PasteEvents
+    def read(self):
+        keys = []
+
+        while True:
+            k = self.stdscr.getch()
+
+            if k == -1:
+                break
+
+            keys.append(k)
+
+        return self.split(keys)
+
+    def split(self, keys):
+        fresh = len(keys) > 0
+        keys = self.pending + keys
+        self.pending = []
+
+        events = []
+        i = 0
+
+        while i < len(keys):
+            k = keys[i]
+
+            if k == 27:
+                marker = PASTE_START if self.paste is None else PASTE_END
+                window = keys[i:i + len(marker)]
+
+                if window == marker:
+                    if self.paste is None:
+                        self.paste = bytearray()
+                    else:
+                        events.append(PasteEvent(self.paste.decode('utf-8', 'replace')))
+                        self.paste = None
+
+                    i += len(marker)
+                    continue
+
+                # wait for the rest of a possible marker, unless nothing else is coming
+                if fresh and window == marker[:len(window)]:
+                    self.pending = window
+                    break
+
+            if self.paste is not None:
+                if k < 256:
+                    self.paste.append(k)
+            else:
+                events.append(KeyEvent(k))
+
+            i += 1
+
+        return events
@@ -0,0 +1,167 @@
+import json
+
+import element
+
+# Key bindings. A key event travels CDOM -> page (capture) -> highlighted element -> page -> CDOM (bubble),
+# and at each stop the key's name is looked up in that level's table. Any handler can call e.preventDefault()
+# to stop it going further. Element tables map key names to methods and live on the element classes, the
+# page and CDOM tables map key names to actions, either a name from `actions` or a function(target, e).
+
+# matches any key that types a character, and any key at all
+PRINTABLE = 'printable'
+ANY = '*'
+
+class Keymap:
+    __slots__ = ('capture', 'bubble')
+
+    def __init__(self, bubble: dict = None, capture: dict = None):
+        self.bubble = {} if bubble is None else dict(bubble)
+        self.capture = {} if capture is None else dict(capture)
+
+    def bind(self, key: str, action, capture = False):
+        (self.capture if capture else self.bubble)[key] = action
+
+    def update(self, other):
+        self.bubble.update(other.bubble)
+        self.capture.update(other.capture)
+
+def lookup(bindings: dict, name: str):
+    binding = bindings.get(name)
+
+    if binding is None and len(name) == 1:
+        binding = bindings.get(PRINTABLE)
+
+    if binding is None:
+        binding = bindings.get(ANY)
+
+    return binding
+
+def activate(cdom, e):
+    highlighted = cdom.currentPage.highlightedElement
+
+    if highlighted:
+        highlighted.activate()
+
+# name -> function(cdom, e)
+actions = {
+    'select-previous': lambda cdom, e: cdom.currentPage.selectPrevious(),
+    'select-next': lambda cdom, e: cdom.currentPage.selectNext(),
+    'back': lambda cdom, e: cdom.goBack(),
+    'forward': lambda cdom, e: cdom.goForward(),
+    'home': lambda cdom, e: cdom.goHome(),
+    'activate': activate
+}
+
+def registerAction(name: str, function):
+    actions[name] = function
+
+# the CDOM's bindings, shared by every page
+globalKeymap = Keymap({
+    'up': 'select-previous',
+    'down': 'select-next',
+    'left': 'back',
+    'right': 'forward',
+    'enter': 'activate'
+})
+
+# url -> user bindings added to that page's own keymap when it's built
+pageKeymaps = {}
+
+# class name -> {key: method name} user bindings applied on top of the class's own table
+classKeymaps = {}
+
+# element class -> {key: function(element, e)}, resolved the first time the class sees a key
+resolved = {}
+
+def classBindings(cls):
+    bindings = resolved.get(cls)
+
+    if bindings is None:
+        names = {}
+
+        for base in reversed(cls.__mro__):
+            names.update(base.__dict__.get('keymap', {}))
+            names.update(classKeymaps.get(base.__name__, {}))
+
+        bindings = resolved[cls] = {key: getattr(cls, name) for key, name in names.items()}
+
+    return bindings
+
+def run(binding, target, cdom, e):
+    if isinstance(binding, str):
+        actions[binding](cdom, e)
+    else:
+        binding(target, e)
+
+def dispatch(cdom, e):
+    page = cdom.currentPage
+    highlighted = page.highlightedElement
+    name = e.name
+
+    for keymap, target in ((cdom.keymap, cdom), (page.keymap, page)):
+        binding = lookup(keymap.capture, name)
+
+        if binding:
+            run(binding, target, cdom, e)
+
+            if e.canceled:
+                return
+
+    if highlighted:
+        if highlighted.onkey:
+            highlighted.onkey(highlighted, e)
+
+        method = lookup(classBindings(type(highlighted)), name)
+
+        if method:
+            method(highlighted, e)
+
+        if e.canceled:
+            return
+
+    for keymap, target in ((page.keymap, page), (cdom.keymap, cdom)):
+        binding = lookup(keymap.bubble, name)
+
+        if binding:
+            run(binding, target, cdom, e)
+
+            if e.canceled:
+                return
+
+# Loads user bindings from a json file and checks them before anything is drawn:
+# {
+#     "global":  { "ctrl-b": "back" },                  CDOM, bubble phase
+#     "capture": { "f1": "home" },                      CDOM, capture phase, runs before the element
+#     "pages":   { "serial-port": { "ctrl-r": "home" } },
+#     "classes": { "Input": { "ctrl-h": "deleteChar" } }
+# }
+def load(path: str):
+    with open(path) as file:
+        config = json.load(file)
+
+    def checkActions(bindings: dict, where: str):
+        for key, action in bindings.items():
+            if action not in actions:
+                raise ValueError(f"{where}: unknown action '{action}' for {key}, expected one of {', '.join(actions)}")
+
+        return bindings
+
+    globalKeymap.bubble.update(checkActions(config.get('global', {}), 'global'))
+    globalKeymap.capture.update(checkActions(config.get('capture', {}), 'capture'))
+
+    for url, bindings in config.get('pages', {}).items():
+        pageKeymaps.setdefault(url, Keymap()).bubble.update(checkActions(bindings, url))
+
+    for className, bindings in config.get('classes', {}).items():
+        cls = getattr(element, className, None)
+
+        if not (isinstance(cls, type) and issubclass(cls, element.Selectable)):
+            raise ValueError(f"classes: '{className}' is not a selectable element")
+
+        for key, method in bindings.items():
+            if not callable(getattr(cls, method, None)):
+                raise ValueError(f"{className}: no method '{method}' for {key}")
+
+        classKeymaps.setdefault(className, {}).update(bindings)
+
+    resolved.clear()
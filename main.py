@@ -1,17 +1,71 @@
+import time
+
+STARTED = time.perf_counter()
+
 import sys,os
+import argparse
 import curses
 
 from cdom import CDOM, CDOMStyle
-from element import Link
-from event import Event, KeyEvent
+from event import PasteEvent
+from keyboard import KeyReader, enableBracketedPaste, disableBracketedPaste
 
 import pages
+import metrics
+import keymap
 
 from enum import Enum
 
-def draw_menu(stdscr):
-    k = -1
-    
+# (name, perf_counter) marks for the startup timing report
+timings = []
+
+def mark(name: str):
+    timings.append((name, time.perf_counter()))
+
+mark('imports')
+
+def startupReport():
+    lines = ['startup timing:']
+    previous = STARTED
+
+    for name, t in timings:
+        lines.append(f"  {name:<12} {(t - STARTED) * 1000:8.2f} ms  (+{(t - previous) * 1000:.2f} ms)")
+        previous = t
+
+    return '\n'.join(lines)
+
+# apply pywal's terminal colors if there are any, without spawning a shell
+def applyWalSequences():
+    try:
+        with open(os.path.expanduser('~/.cache/wal/sequences'), 'rb') as file:
+            sys.stdout.buffer.write(file.read())
+            sys.stdout.flush()
+    except OSError:
+        pass
+
+def handlePaste(cdom, e):
+    page = cdom.currentPage
+    highlighted = page.highlightedElement
+
+    # a paste over something that doesn't take text goes to the nearest field that does
+    if not getattr(highlighted, 'takesText', False):
+        highlighted = page.nearestTextField(highlighted)
+
+        if highlighted is None:
+            cdom.log('Paste ignored, nothing on this page takes text')
+            return
+
+        page.highlightedElement = highlighted
+
+    if getattr(highlighted, 'onpaste', None):
+        highlighted.onpaste(highlighted, e)
+
+    if not e.canceled and hasattr(highlighted, 'defaultOnpaste'):
+        highlighted.defaultOnpaste(e)
+
+def draw_menu(stdscr, args):
+    mark('curses')
+
     stdscr.clear()
     stdscr.refresh()
 
@@ -22,6 +76,7 @@ def draw_menu(stdscr):
     curses.mousemask(1)
 
     cdom = CDOM(stdscr,
+        cacheSize=args.page_cache,
         style=CDOMStyle(
             backgroundColor  = (curses.COLOR_CYAN,  curses.COLOR_CYAN),
             titleColor       = (curses.COLOR_RED,   curses.COLOR_MAGENTA),
@@ -32,68 +87,74 @@ def draw_menu(stdscr):
         )
     )
 
-    cdom.addPages(*pages.pages)
+    cdom.registerPages(pages.pages)
 
     cdom.goHome()
 
-    while True:
+    mark('home page')
 
-        k = stdscr.getch()
+    keys = KeyReader(stdscr)
 
-        height, width = stdscr.getmaxyx()
+    enableBracketedPaste()
 
-        highlighted = cdom.currentPage.highlightedElement
+    firstFrame = True
 
-        if k != -1:
-            # if no highlighted element, nothing below matters
-            if not highlighted:
-                continue
+    try:
+        while True:
+            # handle every key that arrived since the last frame before rendering once
+            for e in keys.read():
+                if isinstance(e, PasteEvent):
+                    handlePaste(cdom, e)
+                else:
+                    cdom.handleKey(e)
 
-            # make key event with k
-            e = KeyEvent(k)
+            height, width = stdscr.getmaxyx()
 
-            # if element has a custom onkey function, run it with e
-            if highlighted.onkey:
-                highlighted.onkey(highlighted, e)
-            
-            if hasattr(highlighted, 'defaultOnkey'):
-                highlighted.defaultOnkey(e)
+            cdom.renderPage(cdom.currentPage, height, width)
 
-            # if e.preventDefault has been called, prevent default
-            if e.canceled:
-                continue
+            if firstFrame:
+                mark('first frame')
+                firstFrame = False
 
-            if k == curses.KEY_LEFT:
-                if cdom.history:
-                    cdom.goToPage(cdom.history.pop(), True)
+            curses.delay_output(16)
+    finally:
+        cdom.close()
 
-            # default key events
-            if k == curses.KEY_UP:
-                cdom.currentPage.selectPrevious()
-            elif k == curses.KEY_DOWN:
-                cdom.currentPage.selectNext()
-            elif KeyEvent.isEnter(k) or (k == curses.KEY_RIGHT and isinstance(highlighted, Link)):
-                if isinstance(highlighted, Link):
-                    cdom.goToPage(highlighted.url)
-                
-                if highlighted.onselect:
-                    e = Event()
+        disableBracketedPaste()
 
-                    highlighted.onselect(highlighted, e)
+def main():
+    parser = argparse.ArgumentParser(description='Curses serial terminal')
+    parser.add_argument('--timing', action='store_true', help='print a startup timing report on exit')
+    parser.add_argument('--page-cache', type=int, default=8, help='number of visited pages kept alive for back/forward navigation')
+    parser.add_argument('--keymap', metavar='PATH', help='json file of extra key bindings, see keymap.load')
+    parser.add_argument('--metrics', metavar='PATH', help='periodically export link and render metrics to PATH')
+    parser.add_argument('--metrics-format', choices=metrics.FORMATS, default='prometheus', help='a Prometheus textfile or one JSON object per line')
+    parser.add_argument('--metrics-interval', type=float, default=10, help='seconds between metrics exports')
+    args = parser.parse_args()
 
-                    if not e.canceled and hasattr(highlighted, 'defaultOnselect'):
-                        highlighted.defaultOnselect()
+    if args.keymap:
+        try:
+            keymap.load(args.keymap)
+        except (OSError, ValueError) as error:
+            parser.error(f"--keymap: {error}")
 
-                elif hasattr(highlighted, 'defaultOnselect'):
-                    highlighted.defaultOnselect()
+    exporter = metrics.Exporter(args.metrics, args.metrics_format, args.metrics_interval) if args.metrics else None
 
-        cdom.renderPage(cdom.currentPage, height, width)
+    if exporter:
+        exporter.start()
 
-        curses.delay_output(16)
+    applyWalSequences()
 
-def main():
-    curses.wrapper(draw_menu)
+    mark('colors')
+
+    try:
+        curses.wrapper(draw_menu, args)
+    finally:
+        if exporter:
+            exporter.stop()
+
+        if args.timing:
+            print(startupReport(), file=sys.stderr)
 
 if __name__ == '__main__':
-    os.system('cat ~/.cache/wal/sequences')
     main()
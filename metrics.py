@@ -0,0 +1,225 @@
+import json
+import os
+import threading
+import time
+
+from abc import ABC, abstractmethod
+from array import array
+from bisect import bisect_left
+
+# Counters and histograms for long running sessions, exported to a Prometheus textfile or a JSON lines file.
+# Updates never take a lock: every thread writes to its own cell and the exporter sums the cells, so a reading
+# may be a moment stale but no update is ever lost. Hot paths update once per chunk read or frame, never per byte.
+
+class Metric(ABC):
+    __slots__ = ('name', 'help', 'local', 'cells')
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, help: str = ''):
+        self.name = name
+        self.help = help
+
+        self.local = threading.local()
+        self.cells = []
+
+    # a fresh per-thread cell, each kind of metric keeps its own shape of state
+    @abstractmethod
+    def newCell(self):
+        pass
+
+    # this thread's cell, created the first time the thread touches the metric
+    def cell(self):
+        try:
+            return self.local.cell
+        except AttributeError:
+            cell = self.local.cell = self.newCell()
+            # list.append is atomic, readers only ever iterate over the cells
+            self.cells.append(cell)
+
+            return cell
+
+class Counter(Metric):
+    __slots__ = ()
+
+    kind = 'counter'
+
+    def newCell(self):
+        return [0]
+
+    def inc(self, amount = 1):
+        self.cell()[0] += amount
+
+    @property
+    def value(self):
+        return sum(cell[0] for cell in list(self.cells))
+
+class Gauge(Metric):
+    __slots__ = ('value',)
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str = ''):
+        super().__init__(name, help)
+        self.value = 0
+
+    # the last value set wins, so a gauge keeps one shared value and never asks for a cell
+    def newCell(self):
+        return None
+
+    def set(self, value):
+        self.value = value
+
+# upper bounds in seconds, good for anything from a fast render to a slow write
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+class Histogram(Metric):
+    __slots__ = ('buckets',)
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str = '', buckets = DEFAULT_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(sorted(buckets))
+
+    # bucket counts (the last one is +Inf) and the sum of observed values
+    def newCell(self):
+        return [array('L', [0] * (len(self.buckets) + 1)), 0.0]
+
+    def observe(self, value: float):
+        cell = self.cell()
+
+        cell[0][bisect_left(self.buckets, value)] += 1
+        cell[1] += value
+
+    # (cumulative bucket counts, count, sum)
+    @property
+    def value(self):
+        counts = [0] * (len(self.buckets) + 1)
+        total = 0.0
+
+        for bucketCounts, cellSum in list(self.cells):
+            for i, count in enumerate(bucketCounts):
+                counts[i] += count
+
+            total += cellSum
+
+        for i in range(1, len(counts)):
+            counts[i] += counts[i - 1]
+
+        return counts, counts[-1], total
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    # get or create, so modules can declare their metrics at import time in any order
+    def register(self, cls, name: str, help: str, **options):
+        with self.lock:
+            metric = self.metrics.get(name)
+
+            if metric is None:
+                metric = self.metrics[name] = cls(name, help, **options)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"metric {name} is already a {metric.kind}")
+
+            return metric
+
+    def counter(self, name: str, help: str = ''):
+        return self.register(Counter, name, help)
+
+    def gauge(self, name: str, help: str = ''):
+        return self.register(Gauge, name, help)
+
+    def histogram(self, name: str, help: str = '', buckets = DEFAULT_BUCKETS):
+        return self.register(Histogram, name, help, buckets=buckets)
+
+    # Prometheus text exposition format
+    def prometheus(self):
+        lines = []
+
+        for metric in list(self.metrics.values()):
+            if metric.help:
+                lines.append(f"# HELP {metric.name} {metric.help}")
+
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+
+            if isinstance(metric, Histogram):
+                counts, count, total = metric.value
+
+                for bound, cumulative in zip(metric.buckets + ('+Inf',), counts):
+                    lines.append(f'{metric.name}_bucket{{le="{bound}"}} {cumulative}')
+
+                lines.append(f"{metric.name}_sum {total}")
+                lines.append(f"{metric.name}_count {count}")
+            else:
+                lines.append(f"{metric.name} {metric.value}")
+
+        return '\n'.join(lines) + '\n'
+
+    # name -> value, histograms as {'buckets': {bound: cumulative count}, 'count': n, 'sum': s}
+    def snapshot(self):
+        values = {}
+
+        for metric in list(self.metrics.values()):
+            if isinstance(metric, Histogram):
+                counts, count, total = metric.value
+
+                values[metric.name] = {
+                    'buckets': dict(zip(map(str, metric.buckets + ('+Inf',)), counts)),
+                    'count': count,
+                    'sum': total
+                }
+            else:
+                values[metric.name] = metric.value
+
+        return values
+
+registry = Registry()
+
+FORMATS = ['prometheus', 'jsonl']
+
+# writes the registry to path every `interval` seconds from a background thread
+class Exporter:
+    def __init__(self, path: str, format: str = 'prometheus', interval: float = 10, registry: Registry = registry):
+        self.path = path
+        self.format = format
+        self.interval = interval
+        self.registry = registry
+
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.export()
+
+    def export(self):
+        try:
+            if self.format == 'jsonl':
+                with open(self.path, 'a') as file:
+                    file.write(json.dumps({ 'time': time.time(), **self.registry.snapshot() }) + '\n')
+            else:
+                # the textfile collector may read at any moment, so swap in a complete file
+                tmp = self.path + '.tmp'
+
+                with open(tmp, 'w') as file:
+                    file.write(self.registry.prometheus())
+
+                os.replace(tmp, self.path)
+        except OSError:
+            pass
+
+    # stop and write one last time so the final counts aren't lost
+    def stop(self):
+        self.stopped.set()
+
+        if self.thread:
+            self.thread.join()
+
+        self.export()
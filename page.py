@@ -1,43 +1,67 @@
 from cdom import CDOM
 from element import Selectable, Link
+from keymap import Keymap
 
 from copy import deepcopy
 
 class PageStyle():
+    __slots__ = ('border', 'margin', 'shadow')
+
     def __init__(self, border = True, margin = (1, 1), shadow = True):
         self.border = border
         self.margin = margin
         self.shadow = shadow
 
+    # page styles are never changed after creation, so copies can share them
+    def copy(self):
+        return self
+
+PageStyle.DEFAULT = PageStyle()
+
 class Page:
-    def __init__(self, url: str, title: str, elements: list, size: tuple = (None, None), style: PageStyle = PageStyle(), data: dict = {}, stateless = True, onload = None, onunload = None, onrefresh = None):
+    __slots__ = ('url', 'title', 'size', 'displaySize', 'style', 'elements', 'data', 'stateless', 'onload', 'onunload', 'onrefresh', 'highlightedElement', 'cdom', 'loaded', 'displayLine', 'windowed', 'keymap')
+
+    def __init__(self, url: str, title: str, elements: list, size: tuple = (None, None), style: PageStyle = None, data: dict = None, stateless = True, onload = None, onunload = None, onrefresh = None, windowed = False, keymap: Keymap = None):
         self.url = url
         self.title = title
         self.size = size
         self.displaySize = (0, 0)
-        self.style = style
+        self.style = PageStyle.DEFAULT if style is None else style
         self.elements = elements
-        self.data = data
+        self.data = {} if data is None else data
         self.stateless = stateless
         self.onload = onload
         self.onunload = onunload
         self.onrefresh = onrefresh
 
         self.highlightedElement = None
+        self.cdom = None
         self.selectNext()
 
+        self.loaded = False
+        # scroll position saved while the page isn't displayed
+        self.displayLine = 0
+
+        # draw controls and stream (split at the first Wallbreak) into separate curses windows
+        self.windowed = windowed
+
+        # bindings for this page, between the highlighted element's and the CDOM's
+        self.keymap = Keymap() if keymap is None else keymap
+
     def copy(self):
         cp = Page(
-            url=self.url[:],
-            title=self.title[:],
-            size=self.size + tuple(),
-            style=deepcopy(self.style),
+            url=self.url,
+            title=self.title,
+            size=self.size,
+            style=self.style.copy(),
             elements=[elem.copy() for elem in self.elements],
-            data=deepcopy(self.data),
+            data=deepcopy(self.data) if self.data else None,
             stateless=self.stateless,
             onload=self.onload,
             onunload=self.onunload,
-            onrefresh=self.onrefresh
+            onrefresh=self.onrefresh,
+            windowed=self.windowed,
+            keymap=self.keymap
         )
 
         cp.setCDOM(self.cdom)
@@ -79,6 +103,13 @@ class Page:
 
         self.highlightedElement = None
 
+    # the visible element that takes text nearest to `element` in page order, an earlier one wins a tie
+    def nearestTextField(self, element = None):
+        index = self.elements.index(element) if element in self.elements else 0
+        fields = [(abs(i - index), i, elem) for i, elem in enumerate(self.elements) if getattr(elem, 'takesText', False) and elem.style.display]
+
+        return min(fields)[2] if fields else None
+
     def getElementByID(self, ID: str):
         for elem in self.elements:
             if elem.ID == ID:
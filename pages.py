@@ -1,30 +1,128 @@
 import curses
 
 from page import Page, PageStyle
-from element import Element, Style, Align, Selectable, Link, Break, Wallbreak, Input, Dropdown, Checkbox
+from element import Element, Style, Align, Selectable, Link, Break, Wallbreak, Input, Dropdown, Checkbox, Stream
 from connection import SerialConnection, currentTime
 from event import KeyEvent
+from plot import Plot, loadNumpy
+from backlog import POLICIES
+from script import ScriptRunner, ScriptError
 
-import subprocess
-import re
+import decoder
 
-import serial.tools.list_ports
+import os
+import re
+import threading
 
 customBaudrate = False
 startTime = 0
 
 connection = SerialConnection()
 
+analysis = None
+
+script = None
+
 def select_port(this, e):
+    connection.transport = 'serial'
     connection.port = this.ID
 
+def select_pty(this, e):
+    connection.transport = 'pty'
+    connection.port = None
+
+def set_network(this, e):
+    page = this.page
+
+    connection.transport = page.getElementByID('network-transport').value
+    connection.port = page.getElementByID('network-address').value
+
+def set_replay(this, e):
+    page = this.page
+
+    connection.transport = 'replay'
+    connection.port = page.getElementByID('replay-path').value
+    speed = page.getElementByID('replay-speed').value
+    connection.replaySpeed = 0 if speed == 'max' else float(speed)
+
+# marks a settings field whose value can't be used, the setting keeps its previous value
+def mark_field(field, valid: bool):
+    label = field.label.removesuffix(' (invalid)')
+
+    field.label = label if valid else label + ' (invalid)'
+    field.updateText()
+
+# a positive whole number of KiB from a field, in bytes, or None
+def parse_kib(field):
+    try:
+        value = int(field.value) * 1024
+    except ValueError:
+        return None
+
+    return value if value > 0 else None
+
 def set_values(this, e):
     page = this.page
 
     connection.baudrate = page.getElementByID('baudrate').value if not customBaudrate else page.getElementByID('baudrate-custom').value
     connection.showTime = page.getElementByID('show-time').checked
 
+    connection.framing = page.getElementByID('framing').value
+    connection.decoder = page.getElementByID('decoder').value
+    connection.splitLines = page.getElementByID('split-lines').checked
+
+    connection.recordPath = page.getElementByID('record-path').value or None
+
+    trigger = page.getElementByID('trigger-pattern')
+
+    # compiled the way Trigger compiles it, as a bytes pattern
+    try:
+        re.compile(trigger.value.encode('utf-8'))
+    except re.error:
+        mark_field(trigger, False)
+
+        # stay on the settings page, the other settings are still applied
+        e.preventDefault()
+    else:
+        mark_field(trigger, True)
+
+        connection.triggerPattern = trigger.value or None
+
+    connection.triggerDirectory = page.getElementByID('trigger-directory').value or '.'
+
+    for ID, setting in (('trigger-pre', 'triggerPre'), ('trigger-post', 'triggerPost')):
+        field = page.getElementByID(ID)
+        size = parse_kib(field)
+
+        mark_field(field, size is not None)
+
+        if size is not None:
+            setattr(connection, setting, size)
+
+    connection.supervised = page.getElementByID('supervised').checked
+
+    connection.rtscts = page.getElementByID('rtscts').checked
+    connection.xonxoff = page.getElementByID('xonxoff').checked
+
+    connection.backlogPolicy = page.getElementByID('backlog-policy').value
+
+    highField = page.getElementByID('backlog-high')
+    lowField = page.getElementByID('backlog-low')
+
+    high = parse_kib(highField)
+    low = parse_kib(lowField)
+
+    mark_field(highField, high is not None)
+    mark_field(lowField, low is not None and (high is None or low <= high))
+
+    if high is not None and low is not None and low <= high:
+        connection.backlogHigh = high
+        connection.backlogLow = low
+
 def load_serial_ports(page):
+    # pyserial's port listing is slow to import, only pay for it when the page is opened
+    import serial.tools.list_ports
+
     devices = [tuple(p) for p in list(serial.tools.list_ports.comports())]
 
     for devData in devices:
@@ -42,6 +140,15 @@ def load_serial_ports(page):
 
         link.updateText()
 
+# framers and decoders can be registered after startup, so the choices are read each time the page opens
+def load_options(this, registry: dict):
+    this.valueList = list(registry.keys())
+
+    if this.value not in this.valueList:
+        this.value = this.valueList[0]
+
+    this.updateText()
+
 def send_data(this, e):
     if this.value != '' and not this.selected:
         connection.send(this.value)
@@ -50,14 +157,30 @@ def send_data(this, e):
 
         this.selected = True
 
+# pasted lines go straight to the port in one write, a trailing partial line stays in the input
+def paste_data(this, e):
+    text = this.value + e.text.replace('\r\n', '\n').replace('\r', '\n')
+
+    if '\n' in text:
+        lines, _, this.value = text.rpartition('\n')
+
+        connection.send(lines)
+    else:
+        this.value = text
+
+    this.selected = True
+    this.updateText()
+
+    e.preventDefault()
+
 def toggle_custom_baudrate(this, e):
     global customBaudrate
 
     custom = this.page.getElementByID('baudrate-custom')
     baudrate = this.page.getElementByID('baudrate')
 
-    custom.style.display = not custom.style.display
-    baudrate.style.display = not baudrate.style.display
+    custom.setStyle(display=not custom.style.display)
+    baudrate.setStyle(display=not baudrate.style.display)
 
     customBaudrate = not customBaudrate
 
@@ -65,6 +188,8 @@ def toggle_output(this, e):
     if KeyEvent.isEnter(e.key):
         this.text = 'Resume Output (use arrow keys to traverse output)' if connection.output else 'Pause Output'
         connection.output = not connection.output
+
+        this.page.getElementByID('serial-data').follow = connection.output
     
     if not connection.output:
         dataElem = this.page.getElementByID('serial-data')
@@ -79,7 +204,7 @@ def toggle_output(this, e):
         else:
             dataElem.data['scrollVelocity'] = vel = 1
         
-        maxheight = len(dataElem.text.split('\n')) - 1
+        maxheight = dataElem.lineCount() - 1
 
         if e.key == curses.KEY_UP:
             dataElem.style.displayIndex -= int(1 * vel) if dataElem.style.displayIndex > 0 else 0
@@ -99,17 +224,182 @@ def toggle_output(this, e):
         
         dataElem.data['prevTime'] = currentTime()
 
-pages = [
-    # Page(
-    #     url='home',
-    #     title='test',
-    #     size=(10, 40),
-    #     style=PageStyle(
-    #         margin=(2, 2)
-    #     ),
-    #     elements=[Selectable(text=str(i)) for i in range(10)]
-    # ),
-    Page(
+def apply_filter(this, e):
+    if this.selected:
+        return
+
+    include = this.page.getElementByID('filter-include')
+    exclude = this.page.getElementByID('filter-exclude')
+
+    patterns = []
+
+    for elem, label in ((include, 'Include'), (exclude, 'Exclude')):
+        try:
+            patterns.append(re.compile(elem.value) if elem.value else None)
+            elem.label = label
+        except re.error:
+            patterns.append(None)
+            elem.label = label + ' (invalid)'
+
+        elem.updateText()
+
+    this.page.getElementByID('serial-data').setFilter(*patterns)
+
+def toggle_hex(this, e):
+    dataElem = this.page.getElementByID('serial-data')
+
+    dataElem.mode = 'text' if dataElem.mode == 'hex' else 'hex'
+    dataElem.style.displayIndex = 0
+
+    this.text = 'Show Text' if dataElem.mode == 'hex' else 'Show Hex'
+
+def toggle_wrap(this, e):
+    dataElem = this.page.getElementByID('serial-data')
+
+    dataElem.setWrap(not dataElem.wrap)
+
+    this.text = 'No Wrap' if dataElem.wrap else 'Wrap Lines'
+
+def stop_script(page):
+    global script
+
+    if script:
+        script.stop()
+
+        if script.onreceive in connection.listeners:
+            connection.listeners.remove(script.onreceive)
+
+        script = None
+
+def run_script(this, e):
+    global script
+
+    if this.selected or not this.value:
+        return
+
+    dataElem = this.page.getElementByID('serial-data')
+
+    stop_script(this.page)
+
+    try:
+        with open(this.value) as file:
+            script = ScriptRunner(file.read(), connection.send, lambda text: dataElem.append(f"\n[{text}]\n"))
+    except (OSError, ScriptError) as error:
+        dataElem.append(f"\n[script not started: {error}]\n")
+        return
+
+    connection.listeners.append(script.onreceive)
+    script.start()
+
+# text the reader has handed over since the last frame, also while the plot hides the stream
+def drain_serial_data(page):
+    text = connection.drain()
+
+    if text:
+        page.getElementByID('serial-data').append(text)
+
+def unload_serial_port(page):
+    stop_script(page)
+    connection.disconnect(page)
+
+def toggle_plot(this, e):
+    dataElem = this.page.getElementByID('serial-data')
+    plot = this.page.getElementByID('serial-plot')
+
+    if not plot.style.display:
+        # numpy is loaded here rather than by the reader on the first numeric line, so reading never stalls
+        # on the import, and a line cut off while the plot was hidden isn't glued onto new data
+        loadNumpy()
+        plot.partial = ''
+
+    plot.setStyle(display=not plot.style.display)
+    dataElem.setStyle(display=not plot.style.display)
+
+    this.text = 'Show Text' if plot.style.display else 'Show Plot'
+
+def run_analysis(this, e):
+    global analysis
+
+    # the analysis module brings in multiprocessing, only pay for it when an analysis is run
+    from analysis import Analysis
+
+    page = this.page
+    status = page.getElementByID('analysis-status')
+    results = page.getElementByID('analysis-results')
+
+    if analysis:
+        analysis.cancel()
+
+    results.clear()
+
+    if not os.path.isfile(page.getElementByID('analysis-path').value):
+        status.text = 'No such file'
+        return
+
+    try:
+        analysis = Analysis(
+            page.getElementByID('analysis-path').value,
+            page.getElementByID('analysis-pattern').value,
+            page.getElementByID('analysis-mode').value
+        )
+    except (re.error, UnicodeError) as error:
+        status.text = f"Invalid pattern: {error}"
+        return
+
+    current = analysis
+
+    def onresult(lines):
+        results.append(''.join(f"{offset:>12}  {line}\n" for offset, line in lines) if current.mode == 'search' else ''.join(line + '\n' for offset, line in lines))
+
+        status.text = f"{current.done}/{current.chunks} chunks, {current.count} lines"
+
+    def ondone():
+        status.text = f"Done: {current.count} lines in {current.chunks} chunks" + (f" (showing {current.kept})" if current.kept < current.count and current.mode != 'count' else '')
+
+    status.text = 'Scanning…'
+
+    analysis.start(onresult, ondone)
+
+def export_analysis(this, e):
+    page = this.page
+    status = page.getElementByID('analysis-status')
+    path = page.getElementByID('analysis-export-path').value
+
+    if not analysis or not path:
+        status.text = 'Run an analysis and choose a file to export to first'
+        return
+
+    current = analysis
+
+    def run():
+        try:
+            current.export(path, lambda done, total: setattr(status, 'text', f"Exporting {done}/{total} chunks"))
+            status.text = 'Exported to ' + path
+        except OSError as error:
+            status.text = f"Export failed: {error}"
+
+    threading.Thread(target=run, daemon=True).start()
+
+def unload_analysis(page):
+    global analysis
+
+    if analysis:
+        analysis.cancel()
+        analysis = None
+
+# def test_page():
+#     return Page(
+#         url='home',
+#         title='test',
+#         size=(10, 40),
+#         style=PageStyle(
+#             margin=(2, 2)
+#         ),
+#         elements=[Selectable(text=str(i)) for i in range(10)]
+#     )
+
+def home_page():
+    return Page(
         url='home',
         title='Serial TUI',
         size=(None, 40),
@@ -126,6 +416,10 @@ pages = [
                 label='Open Serial Port',
                 url='serial-port-select'
             ),
+            Link(
+                label='Analyze Capture File',
+                url='capture-analysis'
+            ),
             Break(),
             Break(),
             Selectable(
@@ -134,15 +428,92 @@ pages = [
             )
         ],
         stateless=False
-    ),
-    Page(
+    )
+
+
+def serial_port_select_page():
+    return Page(
         url='serial-port-select',
         title='Select a Serial Port',
         size=(None, None),
-        elements=[],
+        elements=[
+            Link(
+                label='Connect over the network',
+                url='network-settings'
+            ),
+            Link(
+                label='Open a pty',
+                url='serial-port-settings',
+                onselect=select_pty
+            ),
+            Link(
+                label='Replay a recording',
+                url='replay-settings'
+            )
+        ],
         onload=load_serial_ports
-    ),
-    Page(
+    )
+
+def network_settings_page():
+    return Page(
+        url='network-settings',
+        title='Network',
+        size=(None, None),
+        elements=[
+            Dropdown(
+                valueList=['tcp', 'rfc2217', 'session'],
+                label='Protocol',
+                ID='network-transport'
+            ),
+            Input(
+                label='Address',
+                value='localhost:7000',
+                ID='network-address'
+            ),
+            Link(
+                label='Continue',
+                url='serial-port-settings',
+                onselect=set_network
+            )
+        ],
+        stateless=False
+    )
+
+
+def replay_settings_page():
+    return Page(
+        url='replay-settings',
+        title='Replay',
+        size=(None, None),
+        elements=[
+            Input(
+                label='File',
+                ID='replay-path'
+            ),
+            Element(
+                text='Speed'
+            ),
+            Dropdown(
+                valueList=['1', '2', '5', '10', '100', 'max'],
+                value='1',
+                style=Style(
+                    indent=2
+                ),
+                label='',
+                ID='replay-speed'
+            ),
+            Link(
+                label='Continue',
+                url='serial-port-settings',
+                onselect=set_replay
+            )
+        ],
+        stateless=False
+    )
+
+
+def serial_port_settings_page():
+    return Page(
         url='serial-port-settings',
         title='Settings',
         size=(None, None),
@@ -180,6 +551,118 @@ pages = [
                 label='Show time',
                 ID='show-time'
             ),
+            Element(
+                text='Framing'
+            ),
+            Dropdown(
+                valueList=['none'],
+                value='none',
+                style=Style(
+                    indent=2
+                ),
+                label='',
+                ID='framing',
+                onload=lambda this: load_options(this, decoder.framers)
+            ),
+            Element(
+                text='Decoder'
+            ),
+            Dropdown(
+                valueList=['utf-8'],
+                value='utf-8',
+                style=Style(
+                    indent=2
+                ),
+                label='',
+                ID='decoder',
+                onload=lambda this: load_options(this, decoder.decoders)
+            ),
+            Checkbox(
+                label='Split lines',
+                ID='split-lines',
+                checked=True
+            ),
+            Checkbox(
+                label='Reconnect automatically',
+                ID='supervised'
+            ),
+            Input(
+                label='Record to',
+                ID='record-path'
+            ),
+            Input(
+                label='Trigger on',
+                ID='trigger-pattern'
+            ),
+            Input(
+                value='64',
+                style=Style(
+                    indent=2
+                ),
+                label='Pre-trigger (KiB)',
+                ID='trigger-pre'
+            ),
+            Input(
+                value='64',
+                style=Style(
+                    indent=2
+                ),
+                label='Post-trigger (KiB)',
+                ID='trigger-post'
+            ),
+            Input(
+                value='.',
+                style=Style(
+                    indent=2
+                ),
+                label='Captures in',
+                ID='trigger-directory'
+            ),
+            Element(
+                text='Flow control'
+            ),
+            Checkbox(
+                label='RTS/CTS',
+                style=Style(
+                    indent=2
+                ),
+                ID='rtscts'
+            ),
+            Checkbox(
+                label='XON/XOFF',
+                style=Style(
+                    indent=2
+                ),
+                ID='xonxoff'
+            ),
+            Element(
+                text='When the display falls behind'
+            ),
+            Dropdown(
+                valueList=POLICIES,
+                value='flow-control',
+                style=Style(
+                    indent=2
+                ),
+                label='',
+                ID='backlog-policy'
+            ),
+            Input(
+                value='4096',
+                style=Style(
+                    indent=2
+                ),
+                label='High mark (KiB)',
+                ID='backlog-high'
+            ),
+            Input(
+                value='1024',
+                style=Style(
+                    indent=2
+                ),
+                label='Low mark (KiB)',
+                ID='backlog-low'
+            ),
             Link(
                 label='Connect',
                 url='serial-port',
@@ -187,8 +670,11 @@ pages = [
             )
         ],
         stateless=False
-    ),
-    Page(
+    )
+
+
+def serial_port_page():
+    return Page(
         url='serial-port',
         title='serial port name',
         size=(-2, -2),
@@ -197,16 +683,114 @@ pages = [
                 label='Send',
                 ID='send-input',
                 boxed=False,
-                onselect=send_data
+                onselect=send_data,
+                onpaste=paste_data
             ),
             Selectable(
                 text='Pause Output',
                 onkey=toggle_output
             ),
+            Selectable(
+                text='Show Plot',
+                onselect=toggle_plot
+            ),
+            Selectable(
+                text='Show Hex',
+                onselect=toggle_hex
+            ),
+            Selectable(
+                text='Wrap Lines',
+                onselect=toggle_wrap
+            ),
+            Input(
+                label='Include',
+                ID='filter-include',
+                boxed=False,
+                onselect=apply_filter
+            ),
+            Input(
+                label='Exclude',
+                ID='filter-exclude',
+                boxed=False,
+                onselect=apply_filter
+            ),
+            Input(
+                label='Script',
+                ID='script-path',
+                boxed=False,
+                onselect=run_script
+            ),
+            Selectable(
+                text='Stop Script',
+                onselect=lambda this, e: stop_script(this.page)
+            ),
             Wallbreak(),
-            Element(ID='serial-data')
+            Stream(ID='serial-data'),
+            Plot(
+                ID='serial-plot',
+                style=Style(
+                    display=False
+                )
+            )
         ],
         onload=connection.connect,
-        onunload=connection.disconnect
+        onunload=unload_serial_port,
+        onrefresh=drain_serial_data,
+        windowed=True
     )
-]
\ No newline at end of file
+
+def capture_analysis_page():
+    from analysis import MODES
+
+    return Page(
+        url='capture-analysis',
+        title='Capture Analysis',
+        size=(-2, -2),
+        elements=[
+            Input(
+                label='File',
+                ID='analysis-path',
+                boxed=False
+            ),
+            Input(
+                label='Pattern',
+                ID='analysis-pattern',
+                boxed=False
+            ),
+            Dropdown(
+                valueList=MODES,
+                label='Mode',
+                ID='analysis-mode'
+            ),
+            Selectable(
+                text='Run',
+                onselect=run_analysis
+            ),
+            Input(
+                label='Export to',
+                ID='analysis-export-path',
+                boxed=False
+            ),
+            Selectable(
+                text='Export',
+                onselect=export_analysis
+            ),
+            Element(ID='analysis-status'),
+            Wallbreak(),
+            Stream(ID='analysis-results')
+        ],
+        stateless=False,
+        onunload=unload_analysis,
+        windowed=True
+    )
+
+# url -> factory, each page is only built the first time it's visited
+pages = {
+    'home': home_page,
+    'serial-port-select': serial_port_select_page,
+    'network-settings': network_settings_page,
+    'replay-settings': replay_settings_page,
+    'serial-port-settings': serial_port_settings_page,
+    'serial-port': serial_port_page,
+    'capture-analysis': capture_analysis_page
+}
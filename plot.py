@@ -0,0 +1,267 @@
+import re
+import threading
+
+from array import array
+from copy import deepcopy
+
+from element import Element, Style
+
+# numpy is imported the first time a plot gets data, it's too slow to import at startup
+np = None
+numpyChecked = False
+
+def loadNumpy():
+    global np, numpyChecked
+
+    if not numpyChecked:
+        numpyChecked = True
+
+        try:
+            import numpy as np
+        except ImportError:
+            np = None
+
+NUMBER = re.compile(r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+
+BRAILLE_BASE = 0x2800
+# braille dot bits indexed by [row][column] inside a 2x4 cell
+BRAILLE_DOTS = (
+    (0x01, 0x08),
+    (0x02, 0x10),
+    (0x04, 0x20),
+    (0x40, 0x80)
+)
+# half blocks indexed by bit pattern (1 = top half, 2 = bottom half)
+BLOCKS = (' ', '▀', '▄', '█')
+
+class RingBuffer:
+    __slots__ = ('size', 'decimation', 'data', 'pos', 'count', 'remainder')
+
+    def __init__(self, size: int, decimation: int = 1):
+        loadNumpy()
+
+        self.size = size
+        self.decimation = decimation
+        self.data = np.zeros(size) if np is not None else array('d', bytes(8 * size))
+        self.pos = 0
+        self.count = 0
+
+        # samples waiting to be averaged into one stored point
+        self.remainder = []
+
+    def decimate(self, values):
+        if self.decimation <= 1:
+            return values
+
+        values = self.remainder + list(values)
+        usable = len(values) - len(values) % self.decimation
+        self.remainder = values[usable:]
+
+        if np is not None:
+            return np.asarray(values[:usable]).reshape(-1, self.decimation).mean(axis=1)
+
+        d = self.decimation
+        return [sum(values[i:i + d]) / d for i in range(0, usable, d)]
+
+    def extend(self, values):
+        values = self.decimate(values)
+        n = len(values)
+
+        if n == 0:
+            return
+
+        # only the newest `size` values can survive
+        if n > self.size:
+            values = values[n - self.size:]
+            n = self.size
+
+        first = min(n, self.size - self.pos)
+
+        if np is not None:
+            self.data[self.pos:self.pos + first] = values[:first]
+            self.data[:n - first] = values[first:]
+        else:
+            self.data[self.pos:self.pos + first] = array('d', values[:first])
+            self.data[:n - first] = array('d', values[first:])
+
+        self.pos = (self.pos + n) % self.size
+        self.count = min(self.size, self.count + n)
+
+    def values(self):
+        if self.count < self.size:
+            return self.data[:self.count]
+
+        if np is not None:
+            return np.concatenate((self.data[self.pos:], self.data[:self.pos]))
+
+        return self.data[self.pos:] + self.data[:self.pos]
+
+    def clear(self):
+        self.pos = 0
+        self.count = 0
+        self.remainder = []
+
+# reduce values to `columns` points by averaging equal sized bins
+def binValues(values, columns: int):
+    n = len(values)
+
+    if n <= columns or columns <= 0:
+        return list(values)
+
+    if np is not None:
+        usable = n - n % columns
+        return np.asarray(values)[n - usable:].reshape(columns, -1).mean(axis=1).tolist()
+
+    step = n / columns
+    return [sum(values[int(i * step):int((i + 1) * step)]) / max(1, int((i + 1) * step) - int(i * step)) for i in range(columns)]
+
+class Plot(Element):
+    __slots__ = ('rows', 'size', 'decimation', 'mode', 'maxSeries', 'series', 'partial', 'lock', 'dirty', 'cachedLines', 'cachedWidth')
+
+    def __init__(self, style: Style = None, ID: str = '', classList: list = None, data: dict = None, onrefresh = None, onload = None, onunload = None, rows: int = 12, size: int = 4096, decimation: int = 1, mode: str = 'braille', maxSeries: int = 8):
+        super().__init__('', style, ID, classList, data, onrefresh, onload, onunload)
+
+        self.rows = rows
+        self.size = size
+        self.decimation = decimation
+        self.mode = mode
+        self.maxSeries = maxSeries
+
+        self.series = []
+        self.partial = ''
+        self.lock = threading.Lock()
+
+        self.dirty = True
+        self.cachedLines = []
+        self.cachedWidth = 0
+
+    def copy(self):
+        return Plot(
+            style=self.style.copy(),
+            ID=self.ID[:],
+            classList=self.classList[:],
+            data=deepcopy(self.data) if self.data else None,
+            onrefresh=self.onrefresh,
+            onload=self.onload,
+            onunload=self.onunload,
+            rows=self.rows,
+            size=self.size,
+            decimation=self.decimation,
+            mode=self.mode,
+            maxSeries=self.maxSeries
+        )
+
+    def clear(self):
+        with self.lock:
+            self.series = []
+            self.partial = ''
+            self.dirty = True
+
+    # feed decoded text, only complete lines are parsed
+    def feed(self, text: str):
+        text = self.partial + text
+        end = text.rfind('\n')
+
+        if end == -1:
+            self.partial = text
+            return
+
+        self.partial = text[end + 1:]
+        self.parseLines(text[:end].split('\n'))
+
+    def parseLines(self, lines):
+        # consecutive lines with the same field count form a run that converts in one go, and runs are
+        # kept in arrival order so a line with fewer fields never lands ahead of the lines before it
+        runs = []
+        count = 0
+
+        for line in lines:
+            fields = NUMBER.findall(line)
+
+            if fields:
+                fields = fields[:self.maxSeries]
+
+                if len(fields) != count:
+                    count = len(fields)
+                    runs.append((count, []))
+
+                runs[-1][1].extend(fields)
+
+        if not runs:
+            return
+
+        with self.lock:
+            for count, flat in runs:
+                while len(self.series) < count:
+                    self.series.append(RingBuffer(self.size, self.decimation))
+
+                if np is not None:
+                    columns = np.array(flat, dtype=float).reshape(-1, count).T
+                else:
+                    values = array('d', map(float, flat))
+                    columns = [values[i::count] for i in range(count)]
+
+                for i in range(count):
+                    self.series[i].extend(columns[i])
+
+            self.dirty = True
+
+    def defaultOnrefresh(self):
+        width = max(1, self.page.displaySize[1] - self.page.style.margin[1] * 2 - 1)
+
+        if self.dirty or width != self.cachedWidth:
+            with self.lock:
+                self.cachedLines = self.render(width)
+                self.cachedWidth = width
+                self.dirty = False
+
+    def render(self, width: int):
+        rows = max(1, self.rows - 1)
+
+        if not self.series:
+            return ['waiting for numeric data…'] + [''] * rows
+
+        braille = self.mode == 'braille'
+        xScale, yScale = (2, 4) if braille else (1, 2)
+        columns = width * xScale
+        dots = rows * yScale
+
+        binned = [binValues(buffer.values(), columns) for buffer in self.series]
+        populated = [values for values in binned if len(values)]
+
+        if not populated:
+            return ['waiting for numeric data…'] + [''] * rows
+
+        low = min(min(values) for values in populated)
+        high = max(max(values) for values in populated)
+        span = (high - low) or 1
+
+        cells = [0] * (width * rows)
+
+        for values in binned:
+            # right align so the newest sample is always at the right edge
+            offset = columns - len(values)
+
+            for i, value in enumerate(values):
+                x = offset + i
+                y = dots - 1 - int((value - low) / span * (dots - 1))
+
+                if braille:
+                    cells[(y // 4) * width + x // 2] |= BRAILLE_DOTS[y % 4][x % 2]
+                else:
+                    cells[(y // 2) * width + x] |= 1 << (y % 2)
+
+        if braille:
+            lines = [''.join(chr(BRAILLE_BASE + cell) if cell else ' ' for cell in cells[row * width:(row + 1) * width]) for row in range(rows)]
+        else:
+            lines = [''.join(BLOCKS[cell] for cell in cells[row * width:(row + 1) * width]) for row in range(rows)]
+
+        last = '  '.join(f"{i}: {buffer.values()[-1]:g}" for i, buffer in enumerate(self.series) if buffer.count)
+
+        return [f"{high:g} … {low:g}   {last}"] + lines
+
+    def lines(self):
+        return self.cachedLines
+
+    def displayHeight(self):
+        return self.style.height or self.rows
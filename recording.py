@@ -0,0 +1,144 @@
+import struct
+import threading
+import time
+
+# Recording format: a header followed by records of
+#   uint64 microseconds since the recording started (monotonic clock)
+#   uint8  direction (RX or TX)
+#   uint32 payload length
+# and the payload bytes, all little endian.
+
+MAGIC = b'CSREC\x01'
+RECORD = struct.Struct('<QBI')
+
+RX = 0
+TX = 1
+
+class Recorder:
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, 'wb')
+        self.file.write(MAGIC)
+
+        self.start = time.monotonic()
+        self.lock = threading.Lock()
+
+    def record(self, direction: int, data):
+        if not data:
+            return
+
+        header = RECORD.pack(int((time.monotonic() - self.start) * 1000000), direction, len(data))
+
+        with self.lock:
+            if self.file:
+                self.file.write(header)
+                self.file.write(data)
+
+    def close(self):
+        with self.lock:
+            if self.file:
+                self.file.close()
+                self.file = None
+
+# the header is checked when this is called, so a bad file fails where it's opened instead of in the
+# reader thread, and records are read as they're iterated over
+def readRecording(path: str):
+    file = open(path, 'rb')
+
+    if file.read(len(MAGIC)) != MAGIC:
+        file.close()
+        raise ValueError(path + ' is not a serial recording')
+
+    return readRecords(file)
+
+def readRecords(file):
+    with file:
+        while True:
+            header = file.read(RECORD.size)
+
+            if len(header) < RECORD.size:
+                return
+
+            timestamp, direction, length = RECORD.unpack(header)
+            data = file.read(length)
+
+            if len(data) < length:
+                return
+
+            yield timestamp / 1000000, direction, data
+
+# Stands in for a serial.Serial and plays back the RX side of a recording.
+# speed is a multiplier on the recorded timing, 0 plays as fast as possible.
+class ReplaySource:
+    def __init__(self, path: str, speed: float = 1, timeout: float = 5):
+        self.name = path
+        self.speed = speed
+        self.timeout = timeout
+
+        self.records = (record for record in readRecording(path) if record[1] == RX)
+        self.next = None
+        self.pending = bytearray()
+        self.finished = False
+        # set by close, cuts short a wait for the next record however long the recorded gap was
+        self.closed = threading.Event()
+
+        self.start = time.monotonic()
+
+    def deadline(self, timestamp: float):
+        return self.start + timestamp / self.speed if self.speed else 0
+
+    def peek(self):
+        if self.next is None and not self.finished:
+            self.next = next(self.records, None)
+            self.finished = self.next is None
+
+        return self.next
+
+    def load(self):
+        record = self.peek()
+
+        if record is None:
+            return False
+
+        delay = self.deadline(record[0]) - time.monotonic()
+
+        if delay > 0 and self.closed.wait(delay):
+            return False
+
+        self.pending += record[2]
+        self.next = None
+
+        return True
+
+    @property
+    def in_waiting(self):
+        if not self.pending:
+            record = self.peek()
+
+            if record is not None and self.deadline(record[0]) <= time.monotonic():
+                self.load()
+
+        return len(self.pending)
+
+    def read(self, size: int = 1):
+        # the records are closed by the reading thread, close() may run while one is being read
+        if self.closed.is_set():
+            self.records.close()
+            raise ConnectionResetError(self.name + ' is closed')
+
+        if not self.pending and not self.load():
+            # nothing left to play (or closed), behave like a read timing out on an idle port
+            self.closed.wait(min(self.timeout, 0.1))
+            return b''
+
+        data = bytes(self.pending[:size])
+        del self.pending[:size]
+
+        return data
+
+    def write(self, data):
+        return len(data)
+
+    def close(self):
+        self.finished = True
+        self.closed.set()
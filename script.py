@@ -0,0 +1,190 @@
+import re
+import threading
+import time
+
+# Scripted stimulus sequences, one command per line:
+#
+#   send <text>                       send text followed by a newline
+#   wait <duration>                   e.g. 5ms, 200us, 1.5s (plain numbers are ms)
+#   repeat <n>  ...  end              run the enclosed commands n times
+#   expect <regex> [timeout <dur>]    wait for received text matching regex (default timeout 1s)
+#   # comment
+#
+# Waits are scheduled against monotonic deadlines so they never accumulate drift, how late each send
+# actually went out is kept to report timing jitter.
+
+DURATION = re.compile(r'^(\d+(?:\.\d+)?)\s*(us|µs|ms|s)?$')
+EXPECT = re.compile(r'^(.*?)(?:\s+timeout\s+(\S+))?$')
+
+UNITS = {
+    'us': 1e-6,
+    'µs': 1e-6,
+    'ms': 1e-3,
+    's': 1,
+    None: 1e-3
+}
+
+# the scheduler sleeps until this close to a deadline and spins for the rest
+SPIN = 0.002
+
+class ScriptError(Exception):
+    pass
+
+def parseDuration(text: str, lineNumber: int):
+    match = DURATION.match(text.strip())
+
+    if not match:
+        raise ScriptError(f"line {lineNumber}: bad duration '{text}'")
+
+    return float(match.group(1)) * UNITS[match.group(2)]
+
+# returns a list of ('send', text), ('wait', seconds), ('expect', regex, timeout) and ('repeat', n, body)
+def parseScript(source: str):
+    root = []
+    stack = [ root ]
+
+    for lineNumber, line in enumerate(source.splitlines(), 1):
+        line = line.strip()
+
+        if not line or line.startswith('#'):
+            continue
+
+        command, _, arg = line.partition(' ')
+
+        if command == 'send':
+            stack[-1].append(('send', arg))
+        elif command == 'wait':
+            stack[-1].append(('wait', parseDuration(arg, lineNumber)))
+        elif command == 'expect':
+            pattern, timeout = EXPECT.match(arg).groups()
+
+            try:
+                regex = re.compile(pattern)
+            except re.error as error:
+                raise ScriptError(f"line {lineNumber}: {error}")
+
+            stack[-1].append(('expect', regex, parseDuration(timeout, lineNumber) if timeout else 1))
+        elif command == 'repeat':
+            if not arg.isdigit():
+                raise ScriptError(f"line {lineNumber}: repeat needs a count")
+
+            body = []
+            stack[-1].append(('repeat', int(arg), body))
+            stack.append(body)
+        elif command == 'end':
+            if len(stack) == 1:
+                raise ScriptError(f"line {lineNumber}: end without repeat")
+
+            stack.pop()
+        else:
+            raise ScriptError(f"line {lineNumber}: unknown command '{command}'")
+
+    if len(stack) > 1:
+        raise ScriptError('missing end')
+
+    return root
+
+class ScriptRunner:
+    def __init__(self, source: str, send, report = None):
+        self.commands = parseScript(source)
+        # send(text) transmits, report(text) is shown to the user
+        self.send = send
+        self.report = report or (lambda text: None)
+
+        self.received = ''
+        self.condition = threading.Condition()
+
+        self.deadline = 0
+        self.lateness = []
+
+        self.thread = None
+        self.stopped = False
+
+    # connect to SerialConnection.listeners so expect can see received text
+    def onreceive(self, text: str):
+        with self.condition:
+            self.received = (self.received + text)[-65536:]
+            self.condition.notify()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped = True
+
+        with self.condition:
+            self.condition.notify()
+
+    def sleepUntil(self, deadline: float):
+        while not self.stopped:
+            remaining = deadline - time.monotonic()
+
+            if remaining <= 0:
+                return
+
+            if remaining > SPIN:
+                time.sleep(remaining - SPIN)
+
+    def execute(self, commands):
+        for command in commands:
+            if self.stopped:
+                return
+
+            kind = command[0]
+
+            if kind == 'send':
+                self.sleepUntil(self.deadline)
+                self.send(command[1])
+                # taken once the write has returned, so waiting for the port and the write itself count
+                self.lateness.append(time.monotonic() - self.deadline)
+            elif kind == 'wait':
+                self.deadline += command[1]
+            elif kind == 'repeat':
+                for _ in range(command[1]):
+                    self.execute(command[2])
+            elif kind == 'expect':
+                self.sleepUntil(self.deadline)
+                self.expect(command[1], command[2])
+
+                # time spent waiting on the device isn't part of the schedule
+                self.deadline = time.monotonic()
+
+    def expect(self, regex, timeout: float):
+        deadline = time.monotonic() + timeout
+
+        with self.condition:
+            while not self.stopped:
+                match = regex.search(self.received)
+
+                if match:
+                    self.received = self.received[match.end():]
+                    return
+
+                remaining = deadline - time.monotonic()
+
+                if remaining <= 0:
+                    raise ScriptError(f"timed out expecting '{regex.pattern}'")
+
+                self.condition.wait(remaining)
+
+    def run(self):
+        self.deadline = time.monotonic()
+
+        try:
+            self.execute(self.commands)
+        except ScriptError as error:
+            self.report(f"script failed: {error}")
+            return
+
+        self.report(('script stopped: ' if self.stopped else 'script done: ') + self.jitterReport())
+
+    def jitterReport(self):
+        if not self.lateness:
+            return 'nothing sent'
+
+        lateness = sorted(self.lateness)
+        mean = sum(lateness) / len(lateness)
+        p99 = lateness[min(len(lateness) - 1, int(len(lateness) * 0.99))]
+
+        return f"{len(lateness)} sends, jitter mean {mean * 1e6:.0f}µs p99 {p99 * 1e6:.0f}µs max {lateness[-1] * 1e6:.0f}µs"
@@ -0,0 +1,314 @@
+import os
+import select
+import socket
+import struct
+import threading
+
+from transport import FdTransport, openTransport
+
+# One daemon owns the port and fans received bytes out to any number of clients over a unix socket.
+# Both directions use small framed messages: a type byte and a payload length, then the payload.
+#   DATA    received bytes (daemon -> client) or bytes to send (client -> daemon)
+#   DROPPED an 8 byte count of bytes a slow client missed (daemon -> client)
+#   CLOSED  why the port failed, the last message before the daemon shuts down (daemon -> client)
+#
+# The daemon holds the port with a bare transport, not a SerialConnection: it only reads, fans out and
+# writes. Each viewer is a SerialConnection on a SessionTransport, so decoding, recording, triggers and
+# supervised reconnect (to the socket) happen per viewer. Flow control is set on the daemon with --rtscts
+# and --xonxoff, a viewer's own flow control settings don't reach the port. The daemon doesn't reopen a
+# device that goes away, it tells the viewers why and exits, and supervised viewers reconnect once it's
+# started again.
+
+HEADER = struct.Struct('<BI')
+
+DATA    = 0
+DROPPED = 1
+CLOSED  = 2
+
+# how long a failing daemon waits for each client to be sent its CLOSED message
+CLOSE_TIMEOUT = 1
+
+def message(kind: int, payload):
+    return HEADER.pack(kind, len(payload)) + payload
+
+# splits complete messages off the front of buf, returns a list of (kind, payload)
+def parseMessages(buf: bytearray):
+    messages = []
+    pos = 0
+
+    while len(buf) - pos >= HEADER.size:
+        kind, length = HEADER.unpack_from(buf, pos)
+        end = pos + HEADER.size + length
+
+        if end > len(buf):
+            break
+
+        messages.append((kind, bytes(buf[pos + HEADER.size:end])))
+        pos = end
+
+    if pos:
+        del buf[:pos]
+
+    return messages
+
+class SessionClient:
+    def __init__(self, daemon, sock):
+        self.daemon = daemon
+        self.sock = sock
+
+        self.buffer = bytearray()
+        self.dropped = 0
+        self.alive = True
+        # set once the last message is queued, the writer sends what's left and closes
+        self.finishing = False
+        self.condition = threading.Condition()
+
+        self.writer = None
+
+    def start(self):
+        self.writer = threading.Thread(target=self.writeLoop, daemon=True)
+        self.writer.start()
+
+        threading.Thread(target=self.readLoop, daemon=True).start()
+
+    # called from the daemon's reader thread, never blocks on the client
+    def push(self, data: bytes):
+        with self.condition:
+            if len(self.buffer) + len(data) > self.daemon.clientBuffer:
+                if self.daemon.policy == 'disconnect':
+                    self.alive = False
+                else:
+                    self.dropped += len(data) - HEADER.size
+
+                self.condition.notify()
+                return
+
+            if self.dropped:
+                self.buffer += message(DROPPED, self.dropped.to_bytes(8, 'little'))
+                self.dropped = 0
+
+            self.buffer += data
+            self.condition.notify()
+
+    # queues a last message past the buffer limit, then the client is closed once it has been sent
+    def finish(self, data: bytes):
+        with self.condition:
+            self.buffer += data
+            self.finishing = True
+            self.condition.notify()
+
+    def writeLoop(self):
+        try:
+            while True:
+                with self.condition:
+                    while self.alive and not self.buffer and not self.finishing:
+                        self.condition.wait()
+
+                    if not self.alive or not self.buffer:
+                        return
+
+                    data = bytes(self.buffer)
+                    self.buffer.clear()
+
+                self.sock.sendall(data)
+        except OSError:
+            pass
+        finally:
+            self.close()
+
+    def readLoop(self):
+        incoming = bytearray()
+
+        try:
+            while self.alive:
+                data = self.sock.recv(65536)
+
+                if not data:
+                    break
+
+                incoming += data
+
+                for kind, payload in parseMessages(incoming):
+                    if kind == DATA:
+                        self.daemon.write(payload)
+        except OSError:
+            pass
+        finally:
+            self.close()
+
+    def close(self):
+        with self.condition:
+            self.alive = False
+            self.condition.notify()
+
+        self.daemon.removeClient(self)
+
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+        self.sock.close()
+
+class SessionDaemon:
+    # policy is what happens to a client whose buffer is full: 'drop' its data and tell it how much, or 'disconnect' it
+    def __init__(self, socketPath: str, transport: str, port: str, baudrate: int = 9600, clientBuffer: int = 1024 * 1024, policy: str = 'drop', rtscts: bool = False, xonxoff: bool = False):
+        self.socketPath = socketPath
+        self.clientBuffer = clientBuffer
+        self.policy = policy
+
+        self.ser = openTransport(transport, port, baudrate, timeout=0.5, write_timeout=5, rtscts=rtscts, xonxoff=xonxoff)
+
+        self.clients = []
+        self.clientsLock = threading.Lock()
+        self.writeLock = threading.Lock()
+        self.stillAlive = True
+
+    def addClient(self, client):
+        with self.clientsLock:
+            # copy on write so the reader can walk the list without holding the lock
+            self.clients = self.clients + [ client ]
+
+    def removeClient(self, client):
+        with self.clientsLock:
+            self.clients = [c for c in self.clients if c is not client]
+
+    # transmits from every client go out one at a time
+    def write(self, data: bytes):
+        with self.writeLock:
+            self.ser.write(data)
+
+    # tells every client why the session is over and waits a moment for the message to go out
+    def closeClients(self, reason: str):
+        packet = message(CLOSED, reason.encode('utf-8'))
+        clients = self.clients
+
+        for client in clients:
+            client.finish(packet)
+
+        for client in clients:
+            if client.writer:
+                client.writer.join(CLOSE_TIMEOUT)
+
+    def readPort(self):
+        reason = 'session closed'
+
+        while self.stillAlive:
+            try:
+                data = self.ser.read(self.ser.in_waiting or 1)
+            # the device went away or the other end closed, serial.SerialException is an OSError, retrying
+            # a port in that state fails straight away again so the session ends
+            except OSError as error:
+                reason = str(error) or type(error).__name__
+                break
+
+            if not data:
+                continue
+
+            # framed once, however many clients there are
+            packet = message(DATA, data)
+
+            for client in self.clients:
+                client.push(packet)
+
+        self.closeClients(reason)
+
+        self.stillAlive = False
+
+    def serveForever(self):
+        if os.path.exists(self.socketPath):
+            os.unlink(self.socketPath)
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.socketPath)
+        server.listen()
+
+        threading.Thread(target=self.readPort, daemon=True).start()
+
+        try:
+            while self.stillAlive:
+                ready, _, _ = select.select([ server ], [], [], 0.5)
+
+                if ready:
+                    sock, _ = server.accept()
+                    client = SessionClient(self, sock)
+
+                    self.addClient(client)
+                    client.start()
+        finally:
+            self.stillAlive = False
+            server.close()
+            os.unlink(self.socketPath)
+            self.ser.close()
+
+# a viewer's end of a shared session, used like any other transport
+class SessionTransport(FdTransport):
+    def __init__(self, socketPath: str, timeout: float = 5):
+        super().__init__(socketPath, timeout)
+
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.connect(socketPath)
+
+        self.incoming = bytearray()
+        self.ready = bytearray()
+        # the daemon's reason for closing the session, raised once everything before it has been read
+        self.error = None
+
+    def fileno(self):
+        return self.socket.fileno()
+
+    def recv(self, size: int):
+        return self.socket.recv(65536)
+
+    @property
+    def in_waiting(self):
+        return len(self.ready)
+
+    def read(self, size: int = 1):
+        while not self.ready:
+            if self.error:
+                raise ConnectionResetError(self.error)
+
+            data = super().read()
+
+            if not data:
+                return b''
+
+            self.incoming += data
+
+            for kind, payload in parseMessages(self.incoming):
+                if kind == DATA:
+                    self.ready += payload
+                elif kind == DROPPED:
+                    self.ready += f"\n[{int.from_bytes(payload, 'little')} bytes dropped]\n".encode('utf-8')
+                elif kind == CLOSED:
+                    self.error = f"{self.name}: {str(payload, 'utf-8', 'replace')}"
+
+        data = bytes(self.ready[:size])
+        del self.ready[:size]
+
+        return data
+
+    def write(self, data):
+        self.socket.sendall(message(DATA, bytes(data)))
+        return len(data)
+
+    def close(self):
+        self.closed = True
+        self.socket.close()
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Share one serial port with many viewers over a unix socket')
+    parser.add_argument('socket', help='path of the unix socket to serve on')
+    parser.add_argument('port', help='device, host:port or file to open')
+    parser.add_argument('--transport', default='serial', help='transport kind, see transport.transports')
+    parser.add_argument('--baudrate', type=int, default=9600)
+    parser.add_argument('--client-buffer', type=int, default=1024 * 1024, help='bytes buffered per client before the policy applies')
+    parser.add_argument('--policy', choices=['drop', 'disconnect'], default='drop', help='what to do with clients that fall behind')
+    parser.add_argument('--rtscts', action='store_true', help='hardware (RTS/CTS) flow control on the port')
+    parser.add_argument('--xonxoff', action='store_true', help='software (XON/XOFF) flow control on the port')
+    args = parser.parse_args()
+
+    SessionDaemon(args.socket, args.transport, args.port, args.baudrate, args.client_buffer, args.policy, args.rtscts, args.xonxoff).serveForever()
@@ -0,0 +1,199 @@
+import os
+import select
+import socket
+import threading
+
+from abc import ABC, abstractmethod
+
+from recording import ReplaySource
+
+# Everything SerialConnection talks to looks like a serial.Serial: name, in_waiting, read(size), write(data)
+# and close(). The fd based transports wait with select() and never block past their timeout.
+
+# Base for transports backed by a file descriptor. Subclasses (TcpTransport, PtyTransport and
+# session.SessionTransport) provide fileno(), recv(size), write(data) and close(), this class does the waiting.
+class FdTransport(ABC):
+    def __init__(self, name: str, timeout: float = 5):
+        self.name = name
+        self.timeout = timeout
+        self.closed = False
+
+    # the descriptor read() waits on
+    @abstractmethod
+    def fileno(self):
+        pass
+
+    # up to size bytes once fileno() is readable, b'' when the other end has closed
+    @abstractmethod
+    def recv(self, size: int):
+        pass
+
+    @property
+    def in_waiting(self):
+        import fcntl
+        import termios
+
+        buf = bytearray(4)
+
+        try:
+            fcntl.ioctl(self.fileno(), termios.FIONREAD, buf)
+        except OSError:
+            return 0
+
+        return int.from_bytes(buf, 'little')
+
+    def read(self, size: int = 1):
+        if self.closed:
+            raise ConnectionResetError(self.name + ' is closed')
+
+        ready, _, _ = select.select([ self.fileno() ], [], [], self.timeout)
+
+        if not ready:
+            return b''
+
+        data = self.recv(size)
+
+        if not data:
+            self.closed = True
+            raise ConnectionResetError(self.name + ' closed the connection')
+
+        return data
+
+class TcpTransport(FdTransport):
+    def __init__(self, address: str, timeout: float = 5, write_timeout: float = 5):
+        super().__init__(address, timeout)
+
+        host, _, port = address.rpartition(':')
+
+        self.socket = socket.create_connection((host or 'localhost', int(port)), timeout=timeout)
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        # reads wait in select(), the socket timeout only bounds writes
+        self.socket.settimeout(write_timeout)
+
+    def fileno(self):
+        return self.socket.fileno()
+
+    def recv(self, size: int):
+        return self.socket.recv(max(size, 1))
+
+    def write(self, data):
+        self.socket.sendall(data)
+        return len(data)
+
+    def close(self):
+        self.closed = True
+        self.socket.close()
+
+# opens a new pseudo terminal, programs can connect to the slave side (shown as the name) like a serial port
+class PtyTransport(FdTransport):
+    def __init__(self, timeout: float = 5):
+        import tty
+
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+
+        super().__init__(os.ttyname(self.slave), timeout)
+
+    def fileno(self):
+        return self.master
+
+    # the slave fd stays open on our side, so the master never sees EIO when a program disconnects
+    def recv(self, size: int):
+        return os.read(self.master, max(size, 1))
+
+    def write(self, data):
+        return os.write(self.master, data)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            os.close(self.master)
+            os.close(self.slave)
+
+def openSerial(port: str, baudrate: int, timeout: float, write_timeout: float, rtscts = False, xonxoff = False, **options):
+    import serial
+
+    return serial.Serial(port, baudrate, timeout=timeout, write_timeout=write_timeout, rtscts=rtscts, xonxoff=xonxoff)
+
+def openRfc2217(port: str, baudrate: int, timeout: float, write_timeout: float, rtscts = False, xonxoff = False, **options):
+    import serial
+
+    return serial.serial_for_url('rfc2217://' + port, baudrate=baudrate, timeout=timeout, write_timeout=write_timeout, rtscts=rtscts, xonxoff=xonxoff)
+
+def openTcp(port: str, baudrate: int, timeout: float, write_timeout: float, **options):
+    return TcpTransport(port, timeout, write_timeout)
+
+def openPty(port: str, baudrate: int, timeout: float, write_timeout: float, **options):
+    return PtyTransport(timeout)
+
+def openReplay(port: str, baudrate: int, timeout: float, write_timeout: float, replaySpeed: float = 1, **options):
+    return ReplaySource(port, replaySpeed, timeout)
+
+def openSession(port: str, baudrate: int, timeout: float, write_timeout: float, **options):
+    from session import SessionTransport
+
+    return SessionTransport(port, timeout)
+
+# (vid, pid, serial number) of the usb device behind a serial port, None if it isn't usb
+def deviceIdentity(port: str):
+    from serial.tools import list_ports
+
+    for info in list_ports.comports():
+        if info.device == port and info.vid is not None:
+            return (info.vid, info.pid, info.serial_number)
+
+    return None
+
+# the port a usb device with this identity is on now, None if it isn't plugged in
+def findDevice(identity):
+    from serial.tools import list_ports
+
+    for info in list_ports.comports():
+        if (info.vid, info.pid, info.serial_number) == identity:
+            return info.device
+
+    return None
+
+# kind -> factory(port, baudrate, timeout, write_timeout, **options)
+transports = {
+    'serial': openSerial,
+    'pty': openPty,
+    'tcp': openTcp,
+    'rfc2217': openRfc2217,
+    'replay': openReplay,
+    'session': openSession
+}
+
+def registerTransport(kind: str, factory):
+    transports[kind] = factory
+
+def openTransport(kind: str, port: str, baudrate: int = 9600, timeout: float = 5, write_timeout: float = 5, **options):
+    return transports[kind](port, baudrate, timeout, write_timeout, **options)
+
+# a tcp echo server to try the tcp transport against: python transport.py --echo 7000
+def echoServer(port: int, host: str = 'localhost'):
+    server = socket.create_server((host, port))
+
+    def echo(client):
+        with client:
+            while True:
+                data = client.recv(4096)
+
+                if not data:
+                    return
+
+                client.sendall(data)
+
+    with server:
+        while True:
+            client, _ = server.accept()
+            threading.Thread(target=echo, args=[ client ], daemon=True).start()
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Transport test helpers')
+    parser.add_argument('--echo', type=int, metavar='PORT', required=True, help='run a tcp echo server on PORT')
+    args = parser.parse_args()
+
+    echoServer(args.echo)
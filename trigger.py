@@ -0,0 +1,108 @@
+import os
+import re
+import threading
+import time
+
+import metrics
+
+# Oscilloscope style triggering on received bytes. The last `pre` bytes are kept in a ring, and when a line
+# matches the pattern the pre-trigger window and the next `post` bytes (starting at the matching line) are
+# saved to a capture file. Only whole new lines are searched, once per read and in place in the ring, so
+# the cost per byte is a copy into the ring and the regex engine's scan.
+
+triggers = metrics.registry.counter('serial_triggers_total', 'captures started by the trigger pattern')
+
+# lines longer than this are never matched, so a stream without newlines can't make the ring grow
+MAX_LINE = 64 * 1024
+
+class Trigger:
+    def __init__(self, pattern: str, pre: int = 64 * 1024, post: int = 64 * 1024, directory: str = '.', onfire = None, onsave = None):
+        self.regex = re.compile(pattern.encode('utf-8'))
+        self.pre = pre
+        self.post = post
+        self.directory = directory
+
+        # onfire(path) when the pattern matches, onsave(path, size) once the capture has been written
+        self.onfire = onfire
+        self.onsave = onsave
+
+        self.ring = bytearray()
+        # everything in the ring before this has been searched, it's always the start of a line
+        self.scanned = 0
+
+        # the capture being filled, its path and how much of it came before the trigger
+        self.capture = None
+        self.path = None
+        self.preLength = 0
+
+        self.count = 0
+
+    def feed(self, data):
+        ring = self.ring
+        ring += data
+
+        if self.capture is not None:
+            self.capture += data
+
+            if len(self.capture) - self.preLength >= self.post:
+                self.save()
+
+        end = ring.rfind(b'\n', self.scanned) + 1
+
+        if end:
+            if self.capture is None:
+                match = self.regex.search(ring, self.scanned, end)
+
+                if match:
+                    self.fire(ring.rfind(b'\n', self.scanned, match.start()) + 1 or self.scanned)
+
+            self.scanned = end
+        elif len(ring) - self.scanned > MAX_LINE:
+            self.scanned = len(ring)
+
+        # keep the pre-trigger window before the unsearched part, trimming in big steps so it's amortized
+        if self.scanned > 2 * self.pre + MAX_LINE:
+            excess = self.scanned - self.pre
+            del ring[:excess]
+            self.scanned -= excess
+
+    def fire(self, lineStart: int):
+        start = max(0, lineStart - self.pre)
+
+        self.capture = bytearray(self.ring[start:])
+        self.preLength = lineStart - start
+
+        self.count += 1
+        self.path = os.path.join(self.directory, time.strftime('trigger-%Y%m%d-%H%M%S') + f"-{self.count}.log")
+
+        triggers.inc()
+
+        if self.onfire:
+            self.onfire(self.path)
+
+        if len(self.capture) - self.preLength >= self.post:
+            self.save()
+
+    def save(self):
+        data = bytes(self.capture[:self.preLength + self.post])
+        path = self.path
+
+        self.capture = None
+
+        # the reader goes straight back to reading, the file is written on the side
+        threading.Thread(target=self.write, args=[ path, data ], daemon=True).start()
+
+    def write(self, path: str, data: bytes):
+        try:
+            with open(path, 'wb') as file:
+                file.write(data)
+        except OSError as error:
+            path = f"{path} failed: {error}"
+
+        if self.onsave:
+            self.onsave(path, len(data))
+
+    # a capture that's still waiting for post-trigger data is saved with what it has
+    def close(self):
+        if self.capture is not None:
+            self.save()
@@ -0,0 +1,105 @@
+from array import array
+
+from cellwidth import split
+
+# widths are in terminal cells, a wide character never straddles two rows
+def wrapLine(line: str, width: int):
+    if line.isascii() and len(line) <= width:
+        return [line]
+
+    return split(line, width)
+
+def wrappedRows(line: str, width: int):
+    if line.isascii():
+        return max(1, -(-len(line) // width))
+
+    return len(split(line, width))
+
+# Maps logical lines to screen rows when wrapping at `width` columns. A Fenwick tree over the row count of
+# every line keeps appends, prefix sums and row -> line lookups logarithmic.
+class WrapIndex:
+    __slots__ = ('width', 'tree', 'count')
+
+    def __init__(self, width: int):
+        self.width = max(1, width)
+        self.tree = array('L', [0])
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def rowsFor(self, line: str):
+        return wrappedRows(line, self.width)
+
+    def append(self, rows: int):
+        i = self.count + 1
+        lowbit = i & -i
+
+        # a new node covers (i - lowbit, i], which is its own rows plus the nodes below it
+        self.tree.append(rows + self.prefix(i - 1) - self.prefix(i - lowbit))
+        self.count = i
+
+    def extend(self, lines):
+        if self.count == 0:
+            self.build([self.rowsFor(line) for line in lines])
+        else:
+            for line in lines:
+                self.append(self.rowsFor(line))
+
+    # linear time construction from a list of row counts
+    def build(self, rows):
+        tree = array('L', [0])
+        tree.extend(rows)
+
+        for i in range(1, len(tree)):
+            parent = i + (i & -i)
+
+            if parent < len(tree):
+                tree[parent] += tree[i]
+
+        self.tree = tree
+        self.count = len(rows)
+
+    # forgets the first `lines` lines, the row counts are taken back out of the tree in linear time so no
+    # line has to be measured again
+    def dropFront(self, lines: int):
+        rows = array('L', self.tree)
+
+        for i in range(self.count, 0, -1):
+            parent = i + (i & -i)
+
+            if parent <= self.count:
+                rows[parent] -= rows[i]
+
+        self.build(rows[lines + 1:])
+
+    # number of rows taken up by the first `lines` lines
+    def prefix(self, lines: int):
+        total = 0
+        tree = self.tree
+
+        while lines > 0:
+            total += tree[lines]
+            lines &= lines - 1
+
+        return total
+
+    def total(self):
+        return self.prefix(self.count)
+
+    # the line that screen row `row` belongs to and how many rows into that line it is
+    def find(self, row: int):
+        pos = 0
+        step = 1 << self.count.bit_length()
+        tree = self.tree
+
+        while step:
+            nxt = pos + step
+
+            if nxt <= self.count and tree[nxt] <= row:
+                pos = nxt
+                row -= tree[nxt]
+
+            step >>= 1
+
+        return pos, row